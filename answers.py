@@ -0,0 +1,242 @@
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+from compression import compress_contexts, CONTEXT_COMPRESSION
+from prompts import build_rag_prompt, LLM_MODEL
+from retrieval import query_documents
+from scheduler import get_scheduler, PRIORITY_NORMAL, SchedulerBusyError
+from session_store import state_path, source_refs
+from vectorstore import get_active_index, initialize_collection
+
+# Questions offered as one-click buttons in the assistant; always precomputed
+COMMON_QUESTIONS = [
+    "What is our parental leave policy?",
+    "How is performance evaluation conducted?",
+    "What are our remote work guidelines?",
+    "What is the procedure for handling employee grievances?",
+    "What are our diversity and inclusion initiatives?"
+]
+
+# Serve stored answers for frequent questions instead of running the RAG chain
+PRECOMPUTED_ANSWERS = os.environ.get("PRECOMPUTED_ANSWERS", "1") == "1"
+# Most frequently asked logged questions precomputed in addition to COMMON_QUESTIONS
+PRECOMPUTE_TOP_QUERIES = int(os.environ.get("PRECOMPUTE_TOP_QUERIES", "10"))
+# A logged question must have been asked at least this often to be precomputed
+PRECOMPUTE_MIN_COUNT = int(os.environ.get("PRECOMPUTE_MIN_COUNT", "3"))
+
+ALL_CATEGORIES = "All Categories"
+
+
+def question_key(question):
+    """Normalize a question so trivial variations (case, spacing, final ?) match"""
+    return re.sub(r"\s+", " ", question).strip().rstrip("?!. ").lower()
+
+
+class AnswerStore:
+    """SQLite store of precomputed answers and asked-question counts
+
+    Lives in the shared state directory so the document manager can write
+    answers that the assistant serves.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or state_path("answers.db")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS answers (
+                    question_key TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    sources TEXT,
+                    collection TEXT NOT NULL,
+                    refreshed_at REAL NOT NULL,
+                    PRIMARY KEY (question_key, category)
+                )"""
+            )
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS question_counts (
+                    question_key TEXT NOT NULL,
+                    category TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    count INTEGER NOT NULL,
+                    last_asked REAL NOT NULL,
+                    PRIMARY KEY (question_key, category)
+                )"""
+            )
+
+    def record_question(self, question, category=None):
+        """Count a policy question so frequent ones get precomputed"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                """INSERT INTO question_counts (question_key, category, question, count, last_asked)
+                   VALUES (?, ?, ?, 1, ?)
+                   ON CONFLICT (question_key, category)
+                   DO UPDATE SET count = count + 1, question = excluded.question, last_asked = excluded.last_asked""",
+                (question_key(question), category or ALL_CATEGORIES, question, time.time()),
+            )
+
+    def frequent_questions(self, limit=PRECOMPUTE_TOP_QUERIES, min_count=PRECOMPUTE_MIN_COUNT):
+        """The most asked (question, category) pairs, most frequent first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT question, category FROM question_counts WHERE count >= ? ORDER BY count DESC, last_asked DESC LIMIT ?",
+                (min_count, limit),
+            ).fetchall()
+        return [(row["question"], row["category"]) for row in rows]
+
+    def get(self, question, category=None, collection=None):
+        """A stored answer for the question, or None
+
+        Answers computed against another collection (e.g. before an index
+        migration) are ignored.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM answers WHERE question_key = ? AND category = ?",
+                (question_key(question), category or ALL_CATEGORIES),
+            ).fetchone()
+        if row is None or (collection is not None and row["collection"] != collection):
+            return None
+        return {
+            "question": row["question"],
+            "answer": row["answer"],
+            "sources": json.loads(row["sources"]) if row["sources"] else [],
+            "refreshed_at": row["refreshed_at"],
+        }
+
+    def put(self, question, category, answer, sources, collection):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (question_key(question), category or ALL_CATEGORIES, question, answer,
+                 json.dumps(sources) if sources else None, collection, time.time()),
+            )
+
+    def delete(self, question, category=None):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM answers WHERE question_key = ? AND category = ?",
+                (question_key(question), category or ALL_CATEGORIES),
+            )
+
+    def prune(self, keep):
+        """Drop answers for (question, category) pairs no longer in the precomputed set"""
+        keep = {(question_key(question), category) for question, category in keep}
+        with self._lock, self._conn:
+            rows = self._conn.execute("SELECT question_key, category FROM answers").fetchall()
+            stale = [(row["question_key"], row["category"]) for row in rows
+                     if (row["question_key"], row["category"]) not in keep]
+            self._conn.executemany("DELETE FROM answers WHERE question_key = ? AND category = ?", stale)
+        return len(stale)
+
+
+def questions_to_precompute(store):
+    """COMMON_QUESTIONS over all categories plus the most frequently asked logged questions"""
+    questions = [(question, ALL_CATEGORIES) for question in COMMON_QUESTIONS]
+    seen = {(question_key(question), category) for question, category in questions}
+    for question, category in store.frequent_questions():
+        if (question_key(question), category) not in seen:
+            seen.add((question_key(question), category))
+            questions.append((question, category))
+    return questions
+
+
+def precompute_answers(client, store):
+    """Regenerate the stored answers against the current corpus
+
+    Each question runs the same retrieve / compress / generate path as the
+    assistant (without chat history). Generations go through the shared
+    scheduler at normal priority. That only puts them behind interactive
+    requests of the same process: the assistant runs in another process, and
+    the file slots shared through LLM_SLOT_DIR are first come, first served.
+
+    Returns:
+        int: Number of answers refreshed
+    """
+    active_index = get_active_index(client, refresh=True)
+    collection = initialize_collection(client, active_index.collection)
+    questions = questions_to_precompute(store)
+
+    refreshed = 0
+    for question, category in questions:
+        try:
+            contexts = query_documents(collection, question, category=category, log=False,
+                                       **active_index.embedding_kwargs())
+            if not contexts:
+                # Nothing relevant anymore (e.g. the document was removed)
+                store.delete(question, category)
+                continue
+            if CONTEXT_COMPRESSION:
+                contexts = compress_contexts(question, contexts, model=active_index.embedding_model)
+            response = get_scheduler().generate(
+                "precompute",
+                priority=PRIORITY_NORMAL,
+                model=LLM_MODEL,
+                prompt=build_rag_prompt(question, contexts),
+                stream=False,
+            )
+            store.put(question, category, response["response"], source_refs(contexts), active_index.collection)
+            refreshed += 1
+        except SchedulerBusyError as e:
+            print(f"Warning: Skipped precomputing '{question}': {e}", file=sys.stderr)
+        except Exception as e:
+            print(f"Warning: Failed to precompute '{question}': {e}", file=sys.stderr)
+
+    store.prune(questions)
+    return refreshed
+
+
+class AnswerRefresher:
+    """Runs precompute_answers on a background thread
+
+    Refresh requests made while a refresh is running are coalesced into a single
+    follow-up run, so a batch of uploads triggers at most two refreshes.
+    """
+
+    def __init__(self, client, store):
+        self.client = client
+        self.store = store
+        self.last_refreshed = None
+        self.last_count = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._pending = False
+        self._thread = None
+
+    @property
+    def running(self):
+        with self._lock:
+            return self._thread is not None
+
+    def request(self):
+        """Schedule a refresh; returns immediately"""
+        with self._lock:
+            self._pending = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="answer-refresh", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+                self._pending = False
+            try:
+                self.last_count = precompute_answers(self.client, self.store)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Warning: Answer refresh failed: {e}", file=sys.stderr)
+            self.last_refreshed = time.time()
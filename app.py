@@ -1,141 +1,179 @@
 import streamlit as st
-import weaviate
-import weaviate.exceptions
-import ollama
-import pypdf  # Using pypdf instead of deprecated PyPDF2
 import os
-import tempfile
-import json
-import re
-import weaviate.classes as wvc
-from weaviate.classes.config import Property, DataType
-from langchain_core.messages import HumanMessage, AIMessage
-from langchain.memory import ConversationBufferWindowMemory
-from langchain_core.tools import tool
-from langchain_core.prompts import PromptTemplate
+import time
+import uuid
+import concurrent.futures
+from collections import deque
+from vectorstore import connect_weaviate, initialize_collection, get_active_index, partition, POINTER_TTL_SECONDS
+from memory import WindowMemory, HumanMessage
+from prompts import build_rag_prompt, LLM_MODEL
+from answers import AnswerStore, COMMON_QUESTIONS, PRECOMPUTED_ANSWERS
+from async_pipeline import submit, aquery_documents, agenerate, pipeline_stats, StageTimeoutError, ASYNC_PIPELINE
+from scheduler import get_scheduler, priority_for, SchedulerBusyError
+from retrieval import query_documents, chunk_cache
+from compression import compress_contexts, CONTEXT_COMPRESSION
+from speculation import SpeculativeRetrieval, speculation_stats
+from session_store import SessionStore, source_refs, SESSION_WINDOW, HISTORY_PAGE_SIZE
+
+# Start retrieval while the router is still deciding (disable with SPECULATIVE_RETRIEVAL=0)
+SPECULATIVE_RETRIEVAL = os.environ.get("SPECULATIVE_RETRIEVAL", "1") == "1"
+
+# How often a waiting script run checks on its async request (and for reruns)
+PIPELINE_POLL_SECONDS = 0.25
 
 # Set page configuration
 st.set_page_config(page_title="HR Policy Assistant", layout="wide", page_icon="👔")
 
-# Initialize session state for chat history and memory
+# Persistent chat history shared by all sessions in the process
+@st.cache_resource
+def get_session_store():
+    return SessionStore()
+
+# Precomputed answers for frequent questions, written by the document manager
+@st.cache_resource
+def get_answer_store():
+    return AnswerStore()
+
+# The conversation id lives in the URL so reloading the page resumes the conversation
+if "conversation_id" not in st.session_state:
+    st.session_state.conversation_id = st.query_params.get("conversation") or uuid.uuid4().hex
+    st.query_params["conversation"] = st.session_state.conversation_id
+
+# Initialize session state for chat history and memory; only a bounded window of
+# recent messages is kept in memory, older ones are paged in from the store
 if "messages" not in st.session_state:
-    st.session_state.messages = []
+    st.session_state.messages = deque(
+        get_session_store().recent(st.session_state.conversation_id, SESSION_WINDOW),
+        maxlen=SESSION_WINDOW,
+    )
+if "history_pages" not in st.session_state:
+    st.session_state.history_pages = 0
 
 # Initialize conversational memories with a window of 5 exchanges for each agent
-# Using the new API to avoid deprecation warnings
 if "general_memory" not in st.session_state:
-    st.session_state.general_memory = ConversationBufferWindowMemory(return_messages=True)
-    # Set window size to 5
-    st.session_state.general_memory.k = 5
+    st.session_state.general_memory = WindowMemory(k=5)
     
 if "hr_memory" not in st.session_state:
-    st.session_state.hr_memory = ConversationBufferWindowMemory(return_messages=True)
-    # Set window size to 5
-    st.session_state.hr_memory.k = 5
+    st.session_state.hr_memory = WindowMemory(k=5)
     
 # Track which agent handled each message
 if "agent_mapping" not in st.session_state:
     st.session_state.agent_mapping = {}
 
+# Stable per-session identifier used for fair queueing of LLM generations
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
+# Persist a chat message and add it to the in-memory window
+def add_message(role, content, sources=None):
+    message = get_session_store().append(st.session_state.conversation_id, role, content, sources)
+    st.session_state.messages.append(message)
+
+# Load a chunk's text by UUID for displaying a stored source reference
+@st.cache_data(max_entries=512, ttl=3600, show_spinner=False)
+def load_chunk_text(collection_name, chunk_uuid, category, _collection):
+    handle = partition(_collection, category)
+    obj = handle.query.fetch_object_by_id(chunk_uuid, return_properties=["text"]) if handle is not None else None
+    return obj.properties["text"] if obj is not None else ""
+
+# Display the policy sources of a response
+def render_sources(sources, collection, max_chars=200):
+    with st.expander("View policy sources"):
+        for source in sources:
+            st.write(f"**Policy Document:** {source['source']}")
+            st.write(f"**Category:** {source.get('policy_category', 'General')}")
+            st.write(f"**Page:** {source['page']}")
+            st.write(f"**Last Updated:** {source.get('last_updated', '')}")
+            st.markdown("---")
+            # Fresh responses carry their text; stored messages only keep a reference
+            text = source.get("text")
+            if text is None and source.get("uuid"):
+                text = load_chunk_text(collection.name, source["uuid"], source.get("policy_category"), collection)
+            text = text or ""
+            st.text(text[:max_chars] + "..." if len(text) > max_chars else text)
+
+# Display a chat message from history
+def render_message(message, collection):
+    with st.chat_message(message["role"]):
+        st.markdown(message["content"])
+        
+        # If there are sources, display them
+        if message.get("sources"):
+            render_sources(message["sources"], collection)
+
+# Show the queue position while a generation waits for a free model slot
+def show_queue_position(position, waited):
+    placeholder = st.session_state.get("queue_placeholder")
+    if placeholder is not None:
+        placeholder.info(f"⏳ The assistant is busy. You are number {position} in the queue ({waited:.0f}s waited)...")
+
+# Wait for a request running on the async pipeline, cancelling it if this run is abandoned
+def run_in_pipeline(coro, status=None):
+    """Run a coroutine on the pipeline loop and return its result
+
+    While waiting, the queue placeholder is refreshed every PIPELINE_POLL_SECONDS.
+    Each refresh gives Streamlit a chance to stop this script run when the user
+    submits another question or leaves, and the finally block then cancels the
+    request so it stops holding a model slot.
+    """
+    future = submit(coro)
+    try:
+        return wait_for_pipeline(future.result, status)
+    finally:
+        future.cancel()
+
+# Poll for a pipeline result so Streamlit can stop the run while it waits
+def wait_for_pipeline(result, status=None):
+    while True:
+        try:
+            return result(timeout=PIPELINE_POLL_SECONDS)
+        except concurrent.futures.TimeoutError:
+            placeholder = st.session_state.get("queue_placeholder")
+            if placeholder is None:
+                continue
+            if status and "queue_position" in status:
+                show_queue_position(status["queue_position"], status.get("waited", 0.0))
+            else:
+                placeholder.empty()
+
+# Run an Ollama generation through the process-wide scheduler
+def llm_generate(prompt, priority, stage="generation"):
+    """Generate with llama3 under global admission control
+
+    Args:
+        prompt: Prompt to send to the model
+        priority: Queue priority class, see scheduler.priority_for
+        stage: Deadline applied on the async pipeline ("routing" or "generation")
+    """
+    try:
+        if ASYNC_PIPELINE:
+            status = {}
+            return run_in_pipeline(agenerate(st.session_state.session_id, prompt, priority, stage, status), status)
+        return get_scheduler().generate(
+            st.session_state.session_id,
+            priority=priority,
+            on_wait=show_queue_position,
+            model=LLM_MODEL,
+            prompt=prompt,
+            stream=False,
+        )
+    finally:
+        placeholder = st.session_state.get("queue_placeholder")
+        if placeholder is not None:
+            placeholder.empty()
+
 # Connect to Weaviate instance
 @st.cache_resource
 def get_weaviate_client():
-    weaviate_host = os.environ.get("WEAVIATE_HOST", "localhost")
-    weaviate_grpc_host = os.environ.get("WEAVIATE_GRPC_HOST", weaviate_host)
-    return weaviate.connect_to_custom(
-        http_host=weaviate_host,
-        http_port=8080,
-        http_secure=False,  # Set to True if using HTTPS
-        grpc_host=weaviate_grpc_host,
-        grpc_port=50051,
-        grpc_secure=False,  # Set to True if using secure gRPC
-        additional_config=weaviate.AdditionalConfig(
-            trust_env=True  # Required for custom SSL certificates
-        )
-    )
-# Create a data collection if it doesn't exist
-def initialize_collection(client):
-    collection_name = "hr_policies"
-    try:
-        # Try to get the collection first
-        collection = client.collections.get(collection_name)
-    except weaviate.exceptions.WeaviateCollectionDoesNotExistException:
-        # If collection doesn't exist, create it
-        collection = client.collections.create(
-            name=collection_name,
-            properties=[
-                Property(name="text", data_type=DataType.TEXT),
-                Property(name="source", data_type=DataType.TEXT),
-                Property(name="page", data_type=DataType.INT),
-                Property(name="policy_category", data_type=DataType.TEXT),
-                Property(name="last_updated", data_type=DataType.DATE),
-            ],
-        )
-    return collection
-
-# Extract text from PDF
-def extract_text_from_pdf(pdf_file, file_name, policy_category, last_updated):
-    pdf_reader = pypdf.PdfReader(pdf_file)
-    text_chunks = []
-    
-    for page_num in range(len(pdf_reader.pages)):
-        page = pdf_reader.pages[page_num]
-        text = page.extract_text()
-        if text.strip():  # Only add non-empty pages
-            text_chunks.append({
-                "text": text,
-                "source": file_name,
-                "page": page_num + 1,
-                "policy_category": policy_category,
-                "last_updated": last_updated
-            })
-    
-    return text_chunks
-
-# Function to embed text and store in Weaviate
-def embed_and_store(collection, text_chunks):
-    with collection.batch.fixed_size(batch_size=100) as batch:
-        for chunk in text_chunks:
-            response = ollama.embeddings(model="nomic-embed-text", prompt=chunk["text"])
-            batch.add_object(
-                properties={
-                    "text": chunk["text"],
-                    "source": chunk["source"],
-                    "page": chunk["page"],
-                    "policy_category": chunk.get("policy_category", "General"),
-                    "last_updated": chunk.get("last_updated", "")
-                },
-                vector=response["embedding"],
-            )
-    
-    return len(text_chunks)
+    return connect_weaviate()
 
-# Function to perform RAG query
-def query_documents(collection, query, category=None, limit=5):
-    query_embedding = ollama.embeddings(model="nomic-embed-text", prompt=query)
-    
-    filters = None
-    if category and category != "All Categories":
-        filters = wvc.query.Filter.by_property("policy_category").equal(category)
-    
-    results = collection.query.near_vector(
-        near_vector=query_embedding["embedding"], 
-        filters=filters,
-        limit=limit,
-        return_properties=["text", "source", "page", "policy_category", "last_updated"]
-    )
-    
-    contexts = []
-    for obj in results.objects:
-        contexts.append({
-            "text": obj.properties["text"],
-            "source": obj.properties["source"],
-            "page": obj.properties["page"],
-            "policy_category": obj.properties.get("policy_category", "General"),
-            "last_updated": obj.properties.get("last_updated", "")
-        })
-    
-    return contexts
+# Resolve the active index and its collection handle once per POINTER_TTL_SECONDS
+# instead of on every rerun
+@st.cache_resource(ttl=POINTER_TTL_SECONDS)
+def get_active_collection():
+    client = get_weaviate_client()
+    active_index = get_active_index(client)
+    return active_index, initialize_collection(client, active_index.collection)
 
 # Function to generate response with RAG and memory
 def generate_rag_response(query, contexts):
@@ -143,40 +181,15 @@ def generate_rag_response(query, contexts):
     memory_variables = st.session_state.hr_memory.load_memory_variables({})
     chat_history = memory_variables.get("history", [])
     
-    # Format chat history for context
-    chat_history_text = ""
-    if chat_history:
-        chat_history_text = "\n".join([
-            f"Human: {message.content}" if isinstance(message, HumanMessage) else f"AI: {message.content}"
-            for message in chat_history
-        ])
-        chat_history_text = f"\nChat History:\n{chat_history_text}\n"
-    
-    # Format retrieved documents for context
-    context_text = "\n\n".join([
-        f"Source: {ctx['source']}, Category: {ctx['policy_category']}, Page: {ctx['page']}, Last Updated: {ctx['last_updated']}\n{ctx['text']}" 
-        for ctx in contexts
-    ])
-    
     # Create augmented prompt with both document context and chat history
-    augmented_prompt = f"""You are an HR Policy Assistant. Using the following company policy documents and chat history, answer the HR professional's question about company policies. 
-Be concise, accurate, and helpful. If you don't know the answer based on the provided context, say you don't have enough information.
-
-Context from HR policy documents:
-{context_text}
-{chat_history_text}
-HR professional's question: {query}"""
+    augmented_prompt = build_rag_prompt(query, contexts, chat_history)
 
     # Configure Ollama endpoint
     ollama_host = os.environ.get("OLLAMA_HOST", "localhost")
     os.environ["OLLAMA_HOST"] = f"http://{ollama_host}:11434"
     
     # Generate response
-    response = ollama.generate(
-        model="llama3",
-        prompt=augmented_prompt,
-        stream=False,
-    )
+    response = llm_generate(augmented_prompt, priority_for("rag", query))
     
     # Update HR memory with the new exchange
     st.session_state.hr_memory.save_context(
@@ -186,25 +199,76 @@ HR professional's question: {query}"""
     
     return response["response"], contexts
 
+# Count a policy question so frequently asked ones get precomputed
+def record_question(query, category):
+    try:
+        get_answer_store().record_question(query, category)
+    except Exception as e:
+        print(f"Warning: Could not record question: {e}")
+
+# Serve a precomputed answer for a frequent question, or None if there is none
+def precomputed_answer(query, collection):
+    category = st.session_state.get("selected_category", "All Categories")
+    stored = get_answer_store().get(query, category, collection.name)
+    if stored is None:
+        return None
+    
+    # Questions served from the store still count towards staying precomputed
+    record_question(query, category)
+    
+    # Keep follow-up questions working as if the answer had been generated now
+    st.session_state.hr_memory.save_context({"input": query}, {"output": stored["answer"]})
+    st.session_state.last_sources = stored["sources"]
+    refreshed_at = time.strftime("%Y-%m-%d %H:%M", time.localtime(stored["refreshed_at"]))
+    return f"{stored['answer']}\n\n*Precomputed answer, refreshed at {refreshed_at}.*"
+
 # HR Policy Tool for the RAG Agent
-@tool
 def query_hr_policies(query: str) -> str:
     """
     Use this tool to search for information in HR policy documents.
     This tool should be used for questions about company policies, 
     procedures, benefits, or other HR-related information.
     """
-    client = get_weaviate_client()
-    collection = initialize_collection(client)
+    # The active index decides the collection and how queries are embedded
+    active_index, collection = get_active_collection()
     
     # Get selected category from sidebar if available
     category = st.session_state.get("selected_category", "All Categories")
     
+    # Count the question so frequently asked ones get precomputed
+    record_question(query, category)
+    
+    # Reuse the speculative retrieval started alongside routing when it matches
+    contexts = None
+    speculation = st.session_state.pop("speculative_retrieval", None)
+    if speculation is not None:
+        if speculation.matches(query, category):
+            try:
+                # On the pipeline loop, main() cancels the retrieval if this run is stopped
+                contexts = wait_for_pipeline(speculation.result) if ASYNC_PIPELINE else speculation.result()
+            except Exception as e:
+                print(f"Warning: Speculative retrieval failed, retrying: {e}")
+        else:
+            speculation.discard()
+    
     # Search for relevant policy documents
-    contexts = query_documents(collection, query, category=category)
+    if contexts is None:
+        if ASYNC_PIPELINE:
+            contexts = run_in_pipeline(aquery_documents(collection, query, category=category, **active_index.embedding_kwargs()))
+        else:
+            contexts = query_documents(collection, query, category=category, **active_index.embedding_kwargs())
     
     if not contexts:
-        return "I couldn't find any relevant policy documents. Please upload HR policy documents first or try a different query."
+        # Adaptive retrieval returns nothing when no chunk is close enough
+        st.session_state.last_sources = None
+        return "I couldn't find any policy documents relevant to your question. Please upload HR policy documents first or try rephrasing your query."
+    
+    # Keep only the sentences relevant to the question to shrink the prompt
+    if CONTEXT_COMPRESSION:
+        try:
+            contexts = compress_contexts(query, contexts, model=active_index.embedding_model)
+        except Exception as e:
+            print(f"Warning: Context compression failed, using full pages: {e}")
     
     # Generate response using RAG
     response, sources = generate_rag_response(query, contexts)
@@ -215,7 +279,6 @@ def query_hr_policies(query: str) -> str:
     return response
 
 # General Conversation Tool for basic chats
-@tool
 def general_conversation(query: str) -> str:
     """
     Use this tool for general conversation, greetings, 
@@ -246,12 +309,8 @@ User's message: {query}"""
     ollama_host = os.environ.get("OLLAMA_HOST", "localhost")
     os.environ["OLLAMA_HOST"] = f"http://{ollama_host}:11434"
     
-    # Generate response
-    response = ollama.generate(
-        model="llama3",
-        prompt=prompt,
-        stream=False,
-    )
+    # Generate response (short general prompts get queue priority)
+    response = llm_generate(prompt, priority_for("general", query))
     
     # Update general memory
     st.session_state.general_memory.save_context(
@@ -303,11 +362,7 @@ def determine_tool(query):
     )
     
     # Ask the LLM to decide which tool to use
-    response = ollama.generate(
-        model="llama3",
-        prompt=prompt,
-        stream=False
-    )
+    response = llm_generate(prompt, priority_for("routing", query), stage="routing")
     print(response["response"])
     # Parse the response to determine which tool to use
     tool_choice = response["response"].lower()
@@ -317,32 +372,29 @@ def determine_tool(query):
     else:
         return general_conversation
 
-# Define policy categories
-POLICY_CATEGORIES = [
-    "All Categories",
-    "Recruitment",
-    "Onboarding",
-    "Compensation & Benefits",
-    "Performance Management",
-    "Learning & Development",
-    "Employee Relations",
-    "Health & Safety",
-    "Termination",
-    "Code of Conduct",
-    "Diversity & Inclusion",
-    "Remote Work",
-    "Leave Policies",
-    "Other"
-]
-
 # Main application
 def main():
-    client = get_weaviate_client()
-    collection = initialize_collection(client)
+    active_index, collection = get_active_collection()
     
     # Set default category to "All Categories"
     if "selected_category" not in st.session_state:
         st.session_state.selected_category = "All Categories"
+    
+    # Runtime performance counters for the process
+    with st.sidebar.expander("⚙️ Performance"):
+        scheduler_stats = get_scheduler().stats()
+        st.caption(f"Generations running: {scheduler_stats['running']}, queued: {scheduler_stats['queued']}, "
+                   f"avg wait: {scheduler_stats['avg_wait']:.1f}s")
+        spec = speculation_stats()
+        st.caption(f"Speculative retrievals: {spec['used']} used, {spec['wasted']} wasted "
+                   f"({spec['waste_ratio']:.0%}, {spec['wasted_seconds']:.1f}s of retrieval discarded), "
+                   f"{spec['cancelled']} cancelled before starting")
+        cache = chunk_cache.stats()
+        st.caption(f"Chunk cache: {cache['entries']} chunks, {cache['hit_ratio']:.0%} hit rate")
+        if ASYNC_PIPELINE:
+            pipeline = pipeline_stats()
+            st.caption(f"Async requests: {pipeline['completed']} completed, {pipeline['cancelled']} cancelled, "
+                       f"{pipeline['timed_out']} past their deadline")
       # Main Policy Assistant chat interface with improved styling
     st.markdown("<h1 style='text-align: center; margin-bottom: 0px;'>HR Policy Assistant</h1>", unsafe_allow_html=True)
     st.markdown("<p style='text-align: center; font-size: 1.2em; margin-bottom: 20px;'>An AI tool to help HR professionals navigate company policies</p>", unsafe_allow_html=True)
@@ -357,7 +409,9 @@ def main():
     col1, col2 = st.columns(2)
     with col1:
         if st.button("🗑️ Clear Chat History", use_container_width=True):
-            st.session_state.messages = []
+            get_session_store().clear(st.session_state.conversation_id)
+            st.session_state.messages.clear()
+            st.session_state.history_pages = 0
             st.rerun()
     with col2:
         if st.button("🧹 Clear Conversation Memory", use_container_width=True):
@@ -366,35 +420,32 @@ def main():
             st.info("Conversation memory cleared. The assistant will no longer remember previous interactions.", icon="✅")
       # Quick access to common HR questions
     with st.expander("Common HR Policy Questions", expanded=True):
-        common_questions = [
-            "What is our parental leave policy?",
-            "How is performance evaluation conducted?",
-            "What are our remote work guidelines?",
-            "What is the procedure for handling employee grievances?",
-            "What are our diversity and inclusion initiatives?"
-        ]
-        
         cols = st.columns(3)
-        for i, question in enumerate(common_questions):
+        for i, question in enumerate(COMMON_QUESTIONS):
             with cols[i % 3]:
                 if st.button(question, key=f"q_{i}", use_container_width=True):
                     st.session_state.current_question = question
     
+    # Older history is paged in from the store on request
+    if st.session_state.messages:
+        first_id = st.session_state.messages[0]["id"]
+        if st.session_state.history_pages:
+            older = get_session_store().before(
+                st.session_state.conversation_id, first_id,
+                HISTORY_PAGE_SIZE * st.session_state.history_pages,
+            )
+            for message in older:
+                render_message(message, collection)
+            if older:
+                first_id = older[0]["id"]
+        if get_session_store().count_before(st.session_state.conversation_id, first_id):
+            if st.button("⬆️ Load older messages"):
+                st.session_state.history_pages += 1
+                st.rerun()
+    
     # Display chat messages from history
     for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
-            
-            # If there are sources, display them
-            if "sources" in message:
-                with st.expander("View policy sources"):
-                    for source in message["sources"]:
-                        st.write(f"**Policy Document:** {source['source']}")
-                        st.write(f"**Category:** {source.get('policy_category', 'General')}")
-                        st.write(f"**Page:** {source['page']}")
-                        st.write(f"**Last Updated:** {source.get('last_updated', '')}")
-                        st.markdown("---")
-                        st.text(source['text'][:200] + "..." if len(source['text']) > 200 else source['text'])
+        render_message(message, collection)
       # Input for new query with enhanced styling
     st.markdown("<div style='margin-top: 20px;'></div>", unsafe_allow_html=True)
     if "current_question" in st.session_state:
@@ -405,7 +456,7 @@ def main():
     
     if prompt:
         # Add user message to chat history
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        add_message("user", prompt)
         
         # Display user message in chat
         with st.chat_message("user"):
@@ -413,15 +464,42 @@ def main():
         
         # Display assistant response in chat
         with st.chat_message("assistant"):
+            # Placeholder for queue-position feedback while waiting for a model slot
+            st.session_state.queue_placeholder = st.empty()
             with st.spinner("Processing your request..."):
                 # Configure Ollama endpoint
                 ollama_host = os.environ.get("OLLAMA_HOST", "localhost")
                 os.environ["OLLAMA_HOST"] = f"http://{ollama_host}:11434"
                 
                 # Use our decision function to choose the appropriate tool
+                speculation = None
                 try:
+                    # Frequent questions are answered from the precomputed store
+                    response = precomputed_answer(prompt, collection) if PRECOMPUTED_ANSWERS else None
+                    if response is not None:
+                        st.markdown(response)
+                        render_sources(st.session_state.last_sources, collection, max_chars=300)
+                        add_message("assistant", response, st.session_state.last_sources)
+                        st.session_state.last_sources = None
+                        return
+                    
+                    # Most questions are routed to the RAG tool, so embed and search
+                    # concurrently with routing and drop the result if it isn't
+                    if SPECULATIVE_RETRIEVAL:
+                        speculation = SpeculativeRetrieval(
+                            aquery_documents if ASYNC_PIPELINE else query_documents, collection, prompt,
+                            category=st.session_state.selected_category,
+                            submit=submit if ASYNC_PIPELINE else None,
+                            **active_index.embedding_kwargs(),
+                        )
+                    
                     # Determine which tool to use
                     selected_tool = determine_tool(prompt)
+                    if speculation is not None:
+                        if selected_tool is query_hr_policies:
+                            st.session_state.speculative_retrieval = speculation
+                        else:
+                            speculation.discard()
                     # Execute the selected tool
                     response = selected_tool(prompt)
                     
@@ -429,31 +507,26 @@ def main():
                     st.markdown(response)
                     
                     # If the HR policies tool was used and sources are available, show them
-                    if hasattr(st.session_state, 'last_sources') and st.session_state.last_sources:
-                        with st.expander("View policy sources"):
-                            for source in st.session_state.last_sources:
-                                st.write(f"**Policy Document:** {source['source']}")
-                                st.write(f"**Category:** {source.get('policy_category', 'General')}")
-                                st.write(f"**Page:** {source['page']}")
-                                st.write(f"**Last Updated:** {source.get('last_updated', '')}")
-                                st.markdown("---")
-                                st.text(source['text'][:300] + "..." if len(source['text']) > 300 else source['text'])
+                    if st.session_state.get("last_sources"):
+                        render_sources(st.session_state.last_sources, collection, max_chars=300)
                         
-                        # Add response to chat history with sources
-                        st.session_state.messages.append({
-                            "role": "assistant", 
-                            "content": response,
-                            "sources": st.session_state.last_sources
-                        })
+                        # Add response to chat history with source references (not page texts)
+                        add_message("assistant", response, source_refs(st.session_state.last_sources))
+                        st.session_state.last_sources = None
                     else:
                         # Add response to chat history without sources (general conversation)
-                        st.session_state.messages.append({
-                            "role": "assistant", 
-                            "content": response
-                        })
+                        add_message("assistant", response)
+                except (SchedulerBusyError, StageTimeoutError) as e:
+                    st.warning(str(e), icon="⏳")
                 except Exception as e:
                     st.error(f"Error: {str(e)}")
                     st.markdown("I encountered an error while processing your request. Please try again.")
+                finally:
+                    st.session_state.queue_placeholder = None
+                    # Never leave an unclaimed speculation behind (e.g. routing failed)
+                    if speculation is not None:
+                        speculation.discard()
+                    st.session_state.pop("speculative_retrieval", None)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,257 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import ollama
+import weaviate.classes as wvc
+
+from embeddings import truncate_embedding, EMBEDDING_MODEL, EMBEDDING_DIM, EMBEDDING_RESCORE, RESCORE_SHORTLIST_FACTOR
+from prompts import LLM_MODEL
+from query_log import log_query
+from retrieval import (
+    cached_payloads,
+    chunk_cache,
+    payload_filter,
+    payload_properties,
+    rank_results,
+    search_properties,
+    RETRIEVAL_ADAPTIVE,
+    RETRIEVAL_MAX_K,
+)
+from scheduler import get_scheduler, PRIORITY_NORMAL
+from vectorstore import connect_weaviate_async, is_partitioned, partition, partitions
+
+# Run retrieval and generation on a background event loop so superseded requests
+# can be cancelled (disable with ASYNC_PIPELINE=0 to use the blocking calls)
+ASYNC_PIPELINE = os.environ.get("ASYNC_PIPELINE", "1") == "1"
+
+# Per-stage deadlines in seconds; waiting for a model slot is bounded separately
+# by LLM_MAX_WAIT_SECONDS
+STAGE_DEADLINES = {
+    "retrieval": float(os.environ.get("RETRIEVAL_DEADLINE_SECONDS", "15")),
+    "routing": float(os.environ.get("ROUTING_DEADLINE_SECONDS", "30")),
+    "generation": float(os.environ.get("GENERATION_DEADLINE_SECONDS", "180")),
+}
+
+
+class StageTimeoutError(Exception):
+    """Raised when a pipeline stage runs past its deadline"""
+
+    def __init__(self, stage, seconds):
+        super().__init__(f"The {stage} step took longer than {seconds:.0f}s and was stopped. Please try again.")
+        self.stage = stage
+
+
+class RequestCancelled(Exception):
+    """Raised inside a queued slot request whose caller has gone away"""
+
+
+# Read at import: app.py later rewrites OLLAMA_HOST into a full URL for the blocking client
+_OLLAMA_HOST = os.environ.get("OLLAMA_HOST")
+
+_loop = None
+_loop_lock = threading.Lock()
+_weaviate_client = None
+_ollama_client = None
+
+# Threads blocked in GenerationScheduler.acquire while their request waits in the queue
+_slot_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("LLM_MAX_QUEUE", "50")) + int(os.environ.get("LLM_MAX_CONCURRENCY", "2")),
+    thread_name_prefix="slot-wait",
+)
+
+_stats_lock = threading.Lock()
+_stats = {"submitted": 0, "completed": 0, "cancelled": 0, "timed_out": 0}
+
+
+def _record(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def pipeline_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _get_loop():
+    """Return the process-wide event loop, starting its thread on first use"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="async-pipeline", daemon=True).start()
+        return _loop
+
+
+def submit(coro):
+    """Schedule a coroutine on the pipeline loop
+
+    Returns:
+        concurrent.futures.Future: Calling ``cancel()`` on it cancels the task on
+        the loop, which aborts in-flight HTTP/gRPC calls to Ollama and Weaviate
+    """
+    _record("submitted")
+    future = asyncio.run_coroutine_threadsafe(coro, _get_loop())
+
+    def _count(done):
+        if done.cancelled():
+            _record("cancelled")
+        elif isinstance(done.exception(), StageTimeoutError):
+            _record("timed_out")
+        else:
+            _record("completed")
+
+    future.add_done_callback(_count)
+    return future
+
+
+async def _with_deadline(stage, awaitable):
+    seconds = STAGE_DEADLINES[stage]
+    try:
+        return await asyncio.wait_for(awaitable, seconds)
+    except asyncio.TimeoutError:
+        raise StageTimeoutError(stage, seconds) from None
+
+
+async def _weaviate():
+    # Only ever touched from the loop thread, so no lock is needed
+    global _weaviate_client
+    if _weaviate_client is None:
+        client = connect_weaviate_async()
+        await client.connect()
+        _weaviate_client = client
+    return _weaviate_client
+
+
+def _ollama():
+    global _ollama_client
+    if _ollama_client is None:
+        _ollama_client = ollama.AsyncClient(host=_OLLAMA_HOST)
+    return _ollama_client
+
+
+async def aquery_documents(collection, query, category=None, limit=5, adaptive=None, model=None, dim=None, log=True):
+    """Async counterpart of retrieval.query_documents, bounded by the retrieval deadline
+
+    ``collection`` is the blocking collection handle; it is used (off the loop)
+    for the cached layout and partition lookups, while the embedding and the
+    searches go through the async Ollama and Weaviate clients.
+    """
+    return await _with_deadline("retrieval", _query_documents(collection, query, category, limit, adaptive, model, dim, log))
+
+
+async def _query_documents(collection, query, category, limit, adaptive, model, dim, log):
+    started = time.perf_counter()
+    adaptive = RETRIEVAL_ADAPTIVE if adaptive is None else adaptive
+    top_k = RETRIEVAL_MAX_K if adaptive else limit
+    shortlist = top_k * RESCORE_SHORTLIST_FACTOR if EMBEDDING_RESCORE else top_k
+
+    response = await _ollama().embeddings(model=model or EMBEDDING_MODEL, prompt=query)
+    query_full = response["embedding"]
+    query_vector = truncate_embedding(query_full, EMBEDDING_DIM if dim is None else dim)
+
+    async_collection = (await _weaviate()).collections.get(collection.name)
+
+    def handle_for(tenant):
+        return async_collection.with_tenant(tenant) if tenant else async_collection
+
+    async def search(tenant=None, filters=None):
+        result = await handle_for(tenant).query.near_vector(
+            near_vector=query_vector,
+            filters=filters,
+            limit=shortlist,
+            return_properties=search_properties(),
+            return_metadata=wvc.query.MetadataQuery(distance=True),
+        )
+        return [(tenant, obj) for obj in result.objects]
+
+    async def fetch(tenant, uuids):
+        result = await handle_for(tenant).query.fetch_objects(
+            filters=payload_filter(uuids),
+            limit=len(uuids),
+            return_properties=payload_properties(),
+        )
+        return {obj.uuid: obj.properties for obj in result.objects}
+
+    filtered = bool(category and category != "All Categories")
+    if not await asyncio.to_thread(is_partitioned, collection):
+        filters = wvc.query.Filter.by_property("policy_category").equal(category) if filtered else None
+        results = await search(filters=filters)
+    elif filtered:
+        # Only the category's own partition is searched
+        handle = await asyncio.to_thread(partition, collection, category)
+        results = await search(tenant=handle.tenant) if handle is not None else []
+    else:
+        # Search every active partition concurrently and merge by distance
+        handles = await asyncio.to_thread(partitions, collection)
+        searches = await asyncio.gather(*(search(tenant=handle.tenant) for handle in handles))
+        results = sorted((hit for result in searches for hit in result), key=lambda hit: hit[1].metadata.distance)
+        results = results[:shortlist]
+
+    # Fill in chunk payloads from the cache, fetching only the missing ones
+    payloads, missing = cached_payloads(collection.name, results)
+    cached = len(payloads) if chunk_cache.enabled else 0
+    fetched = {}
+    for result in await asyncio.gather(*(fetch(tenant, uuids) for tenant, uuids in missing.items())):
+        fetched.update(result)
+    chunk_cache.put_many(collection.name, fetched)
+    payloads.update(fetched)
+
+    contexts = rank_results(results, payloads, query_full, top_k, adaptive)
+    if log:
+        record = log if callable(log) else log_query
+        record(query, category, collection.name, contexts, time.perf_counter() - started,
+               cached=cached, fetched=len(payloads) - cached)
+    return contexts
+
+
+async def _acquire_slot(user_id, priority, status):
+    """Wait for a scheduler slot without blocking the loop
+
+    The blocking ``acquire`` runs on a worker thread. If the awaiting task is
+    cancelled, the queued request is withdrawn at its next poll, and a slot that
+    was granted in the meantime is released straight away.
+    """
+    cancelled = threading.Event()
+
+    def on_wait(position, waited):
+        if cancelled.is_set():
+            raise RequestCancelled()
+        status["queue_position"] = position
+        status["waited"] = waited
+
+    future = asyncio.get_running_loop().run_in_executor(
+        _slot_executor, lambda: get_scheduler().acquire(user_id, priority=priority, on_wait=on_wait)
+    )
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        cancelled.set()
+
+        def _release_late_grant(done):
+            if not done.cancelled() and done.exception() is None:
+                done.result()()
+
+        future.add_done_callback(_release_late_grant)
+        raise
+    finally:
+        status.pop("queue_position", None)
+
+
+async def agenerate(user_id, prompt, priority=PRIORITY_NORMAL, stage="generation", status=None):
+    """Generate with the async Ollama client under the shared scheduler
+
+    Cancelling the task closes the HTTP request, so Ollama stops generating and
+    the model slot is released immediately.
+
+    Args:
+        status: Optional dict updated with ``queue_position`` / ``waited`` while queued
+    """
+    release = await _acquire_slot(user_id, priority, status if status is not None else {})
+    try:
+        return await _with_deadline(stage, _ollama().generate(model=LLM_MODEL, prompt=prompt, stream=False))
+    finally:
+        release()
@@ -0,0 +1,114 @@
+"""Startup benchmark for the HR Policy Assistant
+
+Measures, in fresh interpreters, how long it takes to import the modules the
+assistant needs before it can render, and optionally the time to the first
+complete render of app.py using Streamlit's AppTest (needs Weaviate running).
+Exits with status 1 when a measurement exceeds its budget, so it can guard
+against startup regressions in CI.
+
+Usage:
+    python bench_startup.py
+    python bench_startup.py --render --render-budget 10
+"""
+
+import argparse
+import ast
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def app_imports(path=os.path.join(HERE, "app.py")):
+    """Every module app.py imports at module level, read from its source"""
+    with open(path) as f:
+        tree = ast.parse(f.read(), filename=path)
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names = [node.module]
+        else:
+            continue
+        modules.extend(name for name in names if name not in modules)
+    return modules
+
+
+def measure_imports(modules, runs=3):
+    """Median wall time of importing ``modules`` in a fresh interpreter, plus the slowest imports
+
+    Returns:
+        tuple: (median seconds, list of (cumulative microseconds, module) for the slowest imports)
+    """
+    code = "import " + ", ".join(modules)
+    timings = []
+    importtime = ""
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            cwd=HERE, capture_output=True, text=True, check=True,
+        )
+        timings.append(time.perf_counter() - started)
+        importtime = result.stderr
+
+    # Lines look like: "import time:   self [us] |  cumulative | imported package", where
+    # the package name is indented by two more spaces for each level of nesting
+    slowest = []
+    for line in importtime.splitlines():
+        parts = line.split("|")
+        # Only top-level packages, so nested submodules don't repeat their parent's time
+        if len(parts) == 3 and parts[1].strip().isdigit() and not parts[2].startswith("  "):
+            slowest.append((int(parts[1]), parts[2].strip()))
+    slowest.sort(reverse=True)
+    return statistics.median(timings), slowest[:10]
+
+
+def measure_first_render(timeout=60):
+    """Seconds until app.py finishes its first script run in Streamlit's AppTest"""
+    from streamlit.testing.v1 import AppTest
+
+    started = time.perf_counter()
+    app = AppTest.from_file(os.path.join(HERE, "app.py"), default_timeout=timeout)
+    app.run()
+    elapsed = time.perf_counter() - started
+    if app.exception:
+        raise RuntimeError(f"app.py raised during the first render: {app.exception[0].message}")
+    return elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark assistant startup time")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--import-budget", type=float, default=3.0, help="Max seconds to import app modules")
+    parser.add_argument("--render", action="store_true", help="Also measure the first render of app.py")
+    parser.add_argument("--render-budget", type=float, default=10.0, help="Max seconds for the first render")
+    args = parser.parse_args(argv)
+
+    failures = []
+
+    import_seconds, slowest = measure_imports(app_imports(), runs=args.runs)
+    print(f"Import time of app modules: {import_seconds:.2f}s (budget {args.import_budget:.2f}s)")
+    for cumulative_us, module in slowest:
+        print(f"  {cumulative_us / 1e6:6.2f}s  {module}")
+    if import_seconds > args.import_budget:
+        failures.append("import time")
+
+    if args.render:
+        render_seconds = measure_first_render()
+        print(f"First render of app.py: {render_seconds:.2f}s (budget {args.render_budget:.2f}s)")
+        if render_seconds > args.render_budget:
+            failures.append("first render")
+
+    if failures:
+        print(f"Over budget: {', '.join(failures)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
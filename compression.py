@@ -0,0 +1,101 @@
+import os
+import re
+
+import numpy as np
+
+from embeddings import embed_batch
+
+# Extractive compression of retrieved pages before generation
+CONTEXT_COMPRESSION = os.environ.get("CONTEXT_COMPRESSION", "1") == "1"
+# Character budget for all compressed context text sent to the LLM
+CONTEXT_BUDGET_CHARS = int(os.environ.get("CONTEXT_BUDGET_CHARS", "3000"))
+# Sentences kept on each side of a selected sentence so it still reads in context
+CONTEXT_NEIGHBOR_SENTENCES = int(os.environ.get("CONTEXT_NEIGHBOR_SENTENCES", "1"))
+
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n\s*\n|\n(?=\s*(?:[-•*]|\d+[.)])\s)")
+_MIN_SENTENCE_CHARS = 20
+
+
+def split_sentences(text):
+    """Split page text into sentences, treating blank lines and list items as breaks"""
+    sentences = []
+    for part in _SENTENCE_BOUNDARY.split(text):
+        part = " ".join(part.split())
+        if not part:
+            continue
+        # Merge fragments (headings, page numbers) into the previous sentence
+        if sentences and len(part) < _MIN_SENTENCE_CHARS:
+            sentences[-1] = f"{sentences[-1]} {part}"
+        else:
+            sentences.append(part)
+    return sentences
+
+
+def compress_contexts(query, contexts, budget_chars=None, neighbors=None, model=None):
+    """Keep only the sentences of the retrieved chunks most relevant to the query
+
+    All sentences are embedded together with the query in one Ollama request and
+    scored with a single matrix-vector product. The best sentences (plus their
+    neighbors) are picked greedily until the character budget is spent, then
+    reassembled per chunk in their original order so citation metadata (source,
+    page, category, date) is preserved.
+
+    Args:
+        query: The user's question
+        contexts: Chunks returned by query_documents
+        budget_chars: Total characters of context to keep (default CONTEXT_BUDGET_CHARS)
+        neighbors: Sentences kept around each pick (default CONTEXT_NEIGHBOR_SENTENCES)
+        model: Embedding model used to score sentences (default EMBEDDING_MODEL)
+
+    Returns:
+        list: Compressed contexts; chunks with no selected sentence are dropped
+    """
+    budget_chars = CONTEXT_BUDGET_CHARS if budget_chars is None else budget_chars
+    neighbors = CONTEXT_NEIGHBOR_SENTENCES if neighbors is None else neighbors
+
+    if sum(len(ctx["text"]) for ctx in contexts) <= budget_chars:
+        return contexts
+
+    sentences = []  # (context index, sentence index, text)
+    per_context = []
+    for ctx_idx, ctx in enumerate(contexts):
+        split = split_sentences(ctx["text"])
+        per_context.append(split)
+        sentences.extend((ctx_idx, sent_idx, text) for sent_idx, text in enumerate(split))
+    if not sentences:
+        return contexts
+
+    vectors = embed_batch([query] + [text for _, _, text in sentences], model=model)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+    scores = vectors[1:] @ vectors[0]
+
+    selected = [set() for _ in contexts]
+    used_chars = 0
+    for i in np.argsort(-scores):
+        ctx_idx, sent_idx, _ = sentences[i]
+        window = range(max(0, sent_idx - neighbors), min(len(per_context[ctx_idx]), sent_idx + neighbors + 1))
+        new = [j for j in window if j not in selected[ctx_idx]]
+        cost = sum(len(per_context[ctx_idx][j]) + 1 for j in new)
+        if used_chars + cost > budget_chars:
+            if used_chars:
+                continue
+            new = [sent_idx]  # Always keep at least the single best sentence
+            cost = len(per_context[ctx_idx][sent_idx])
+        selected[ctx_idx].update(new)
+        used_chars += cost
+        if used_chars >= budget_chars:
+            break
+
+    compressed = []
+    for ctx_idx, ctx in enumerate(contexts):
+        if not selected[ctx_idx]:
+            continue
+        parts = []
+        previous = None
+        for j in sorted(selected[ctx_idx]):
+            if previous is not None and j != previous + 1:
+                parts.append("…")
+            parts.append(per_context[ctx_idx][j])
+            previous = j
+        compressed.append(dict(ctx, text=" ".join(parts), original_chars=len(ctx["text"])))
+    return compressed
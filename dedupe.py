@@ -0,0 +1,178 @@
+import hashlib
+import re
+
+import numpy as np
+import weaviate.classes as wvc
+
+from vectorstore import partitions
+
+# MinHash signature length and LSH banding (16 bands x 8 rows ~ 0.7 candidate threshold)
+NUM_PERM = 128
+NUM_BANDS = 16
+ROWS_PER_BAND = NUM_PERM // NUM_BANDS
+SHINGLE_SIZE = 5
+
+# Prime just above 2**32 so (a * x + b) stays inside uint64 for 32-bit shingle hashes
+_PRIME = np.uint64(4294967311)
+_rng = np.random.RandomState(42)  # Fixed seed: signatures must be stable across runs
+_PERM_A = _rng.randint(1, 2**32 - 1, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, 2**32 - 1, size=NUM_PERM, dtype=np.uint64)
+
+
+def normalize_text(text):
+    """Lowercase, drop punctuation and collapse whitespace so layout noise doesn't matter"""
+    text = re.sub(r"[^a-z0-9\s]", " ", text.lower())
+    return " ".join(text.split())
+
+
+def content_hash(text):
+    """Exact-duplicate fingerprint of the normalized text"""
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def minhash_signature(text):
+    """Compute a MinHash signature over word shingles of the normalized text
+
+    Returns:
+        np.ndarray: uint32 array of length NUM_PERM
+    """
+    words = normalize_text(text).split()
+    if len(words) < SHINGLE_SIZE:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles),
+        dtype=np.uint64,
+        count=len(shingles),
+    )
+    # One vectorized pass: (num_shingles, NUM_PERM) universal hashes, min over shingles
+    permuted = (np.outer(hashes, _PERM_A) + _PERM_B) % _PRIME
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+def signature_to_str(signature):
+    return signature.astype("<u4").tobytes().hex()
+
+
+def signature_from_str(value):
+    return np.frombuffer(bytes.fromhex(value), dtype="<u4").astype(np.uint32)
+
+
+def estimate_similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of two MinHash signatures"""
+    return float(np.mean(sig_a == sig_b))
+
+
+class DedupeIndex:
+    """Corpus-wide index of chunk fingerprints for exact and near-duplicate lookup
+
+    Exact duplicates are found by content hash; near duplicates via MinHash LSH
+    buckets, confirmed against the estimated Jaccard similarity ``threshold``.
+    Lookups are scoped to a policy category, so a chunk is only linked to a
+    canonical chunk that searches filtered to its own category can reach.
+    """
+
+    def __init__(self, threshold=0.85):
+        self.threshold = threshold
+        self._exact = {}
+        self._buckets = {}
+        self._signatures = {}
+        self.checked = 0
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+
+    def _bands(self, category, signature):
+        for band in range(NUM_BANDS):
+            rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+            yield category, band, rows.tobytes()
+
+    def add(self, uuid, chunk_hash, signature, category=None):
+        """Register a canonical (embedded) chunk of ``category``"""
+        self._exact.setdefault((category, chunk_hash), uuid)
+        self._signatures[uuid] = (category, signature)
+        for key in self._bands(category, signature):
+            self._buckets.setdefault(key, []).append(uuid)
+
+    def remove(self, uuids):
+        """Forget canonical chunks, e.g. after they were deleted again"""
+        uuids = set(uuids)
+        for uuid in uuids:
+            entry = self._signatures.pop(uuid, None)
+            if entry is None:
+                continue
+            for key in self._bands(*entry):
+                self._buckets[key].remove(uuid)
+        self._exact = {key: uuid for key, uuid in self._exact.items() if uuid not in uuids}
+
+    def find(self, chunk_hash, signature, category=None):
+        """Look up a duplicate of a chunk among the canonical chunks of ``category``
+
+        Returns:
+            tuple: (canonical_uuid, similarity) or None if the chunk is new
+        """
+        self.checked += 1
+        if (category, chunk_hash) in self._exact:
+            self.exact_duplicates += 1
+            return self._exact[(category, chunk_hash)], 1.0
+
+        candidates = set()
+        for key in self._bands(category, signature):
+            candidates.update(self._buckets.get(key, ()))
+
+        best = None
+        for candidate in candidates:
+            similarity = estimate_similarity(signature, self._signatures[candidate][1])
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (candidate, similarity)
+        if best is not None:
+            self.near_duplicates += 1
+        return best
+
+    @property
+    def dedupe_ratio(self):
+        """Fraction of checked chunks that were duplicates"""
+        if not self.checked:
+            return 0.0
+        return (self.exact_duplicates + self.near_duplicates) / self.checked
+
+    def __len__(self):
+        return len(self._signatures)
+
+
+def load_index_from_collection(collection, threshold=0.85):
+    """Build a DedupeIndex from every canonical chunk already stored in the collection
+
+    Chunks stored before fingerprinting existed are fingerprinted from their
+    text, which is only fetched for those chunks.
+    """
+    index = DedupeIndex(threshold=threshold)
+    # Collections created before fingerprinting may not have these properties yet
+    existing = {prop.name for prop in collection.config.get().properties}
+    wanted = ["policy_category"] + [name for name in ("content_hash", "minhash", "duplicate_of") if name in existing]
+    # Offloaded partitions of a partitioned collection are not checked
+    for handle in partitions(collection, refresh=True):
+        unfingerprinted = []
+        for obj in handle.iterator(return_properties=wanted):
+            props = obj.properties
+            if props.get("duplicate_of"):
+                continue
+            category = props.get("policy_category") or "General"
+            if props.get("content_hash") and props.get("minhash"):
+                index.add(str(obj.uuid), props["content_hash"], signature_from_str(props["minhash"]), category)
+            else:
+                unfingerprinted.append(obj.uuid)
+
+        for start in range(0, len(unfingerprinted), 100):
+            batch = unfingerprinted[start:start + 100]
+            result = handle.query.fetch_objects(
+                filters=wvc.query.Filter.by_id().contains_any(batch),
+                limit=len(batch),
+                return_properties=["text", "policy_category"],
+            )
+            for obj in result.objects:
+                text = obj.properties.get("text", "")
+                category = obj.properties.get("policy_category") or "General"
+                index.add(str(obj.uuid), content_hash(text), minhash_signature(text), category)
+    return index
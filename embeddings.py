@@ -0,0 +1,85 @@
+import os
+
+import numpy as np
+import ollama
+
+# Embedding model shared by ingestion and querying
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "nomic-embed-text")
+
+# Matryoshka truncation: keep only the first EMBEDDING_DIM dimensions (unset = full size).
+# Must be the same at ingest and query time; changing it requires re-ingesting.
+EMBEDDING_DIM = int(os.environ.get("EMBEDDING_DIM", "0")) or None
+
+# Two-stage search: shortlist on truncated vectors, rescore on full ones stored
+# alongside each chunk in the "full_vector" property
+EMBEDDING_RESCORE = os.environ.get("EMBEDDING_RESCORE", "0") == "1"
+RESCORE_SHORTLIST_FACTOR = int(os.environ.get("RESCORE_SHORTLIST_FACTOR", "4"))
+
+
+def embed_full(text, model=None):
+    """Return the full-size embedding of a text from Ollama"""
+    response = ollama.embeddings(model=model or EMBEDDING_MODEL, prompt=text)
+    return response["embedding"]
+
+
+def embed_batch(texts, model=None):
+    """Embed many texts with a single Ollama request
+
+    Returns:
+        np.ndarray: Matrix of shape (len(texts), dims)
+    """
+    response = ollama.embed(model=model or EMBEDDING_MODEL, input=list(texts))
+    return np.asarray(response["embeddings"], dtype=np.float32)
+
+
+def truncate_embedding(vector, dim=None):
+    """Truncate an embedding to its first ``dim`` dimensions and re-normalize it
+
+    Matryoshka-trained models such as nomic-embed-text front-load information in
+    the leading dimensions, so the prefix is a usable smaller embedding once it
+    is scaled back to unit length.
+    """
+    if not dim or dim >= len(vector):
+        return list(vector)
+    prefix = np.asarray(vector[:dim], dtype=np.float32)
+    norm = np.linalg.norm(prefix)
+    if norm > 0:
+        prefix = prefix / norm
+    return prefix.tolist()
+
+
+def embed_for_index(text, model=None, dim=None):
+    """Embed a text for storage or search
+
+    Returns:
+        tuple: (vector, full_vector) where vector is truncated to ``dim`` (default
+        EMBEDDING_DIM, 0 = no truncation) and full_vector is the untruncated embedding
+    """
+    full = embed_full(text, model=model)
+    return truncate_embedding(full, EMBEDDING_DIM if dim is None else dim), full
+
+
+def rescore_by_full_vector(query_full, candidates, limit):
+    """Re-rank shortlisted chunks by cosine similarity of their full embeddings
+
+    Args:
+        query_full: Full-size query embedding
+        candidates: List of (item, full_vector) pairs in shortlist order; items
+            without a stored full vector keep their shortlist position at the end
+        limit: Number of items to return
+
+    Returns:
+        list: Up to ``limit`` (item, cosine_distance) pairs, best first
+    """
+    with_vectors = [(item, vec) for item, vec in candidates if vec]
+    without_vectors = [(item, None) for item, vec in candidates if not vec]
+    if not with_vectors:
+        return without_vectors[:limit]
+
+    query = np.asarray(query_full, dtype=np.float32)
+    matrix = np.asarray([vec for _, vec in with_vectors], dtype=np.float32)
+    # Single batched cosine computation over the whole shortlist
+    similarities = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12)
+    order = np.argsort(-similarities)
+    ranked = [(with_vectors[i][0], float(1.0 - similarities[i])) for i in order]
+    return (ranked + without_vectors)[:limit]
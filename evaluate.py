@@ -0,0 +1,309 @@
+"""Offline evaluation of retrieval quality and latency
+
+Runs a golden set of questions through retrieval under several configurations
+and prints a comparison table with recall@k, MRR, p50/p95 retrieval latency and
+the estimated prompt size each configuration would send to the LLM.
+
+The golden set is a JSONL file, one question per line:
+
+    {"question": "How many vacation days do new hires get?", "source": "leave_policy.pdf", "page": 3}
+
+``page`` and ``category`` are optional; without a page any chunk of the expected
+document counts as a hit.
+
+Two backends are available:
+
+- ``weaviate`` runs ``retrieval.query_documents`` against a live collection
+  (the active index by default, or e.g. a shadow collection built by
+  migrate.py) with the model and dimension it was built with, exactly as the
+  assistant does
+- ``snapshot`` loads a snapshot directory (see snapshot.py) into memory and
+  searches it with numpy; query embeddings are cached on disk so repeated runs
+  don't need Ollama, and embedding truncation can be swept without re-indexing
+
+Usage:
+    python evaluate.py golden.jsonl --limit 3 5 8 --adaptive off on
+    python evaluate.py golden.jsonl --collection hr_policies_v2
+    python evaluate.py golden.jsonl --backend snapshot --snapshot ./snapshots/2025-05-23 --dim 0 256 128
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from compression import compress_contexts
+from embeddings import embed_full, truncate_embedding, EMBEDDING_MODEL
+from prompts import build_rag_prompt, estimate_tokens
+from retrieval import autocut, chunk_cache, query_documents, RETRIEVAL_MAX_K
+from session_store import state_path
+from snapshot import MANIFEST_FILE, VECTORS_FILE, METADATA_FILE, _require_pyarrow, pq
+
+
+def load_golden_set(path):
+    """Read the golden set, skipping blank lines"""
+    items = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if "question" not in item or "source" not in item:
+                raise ValueError(f"{path}:{line_number}: each entry needs a question and a source")
+            items.append(item)
+    return items
+
+
+def first_hit_rank(contexts, item):
+    """1-based rank of the first context matching the expected source/page, or None"""
+    for rank, ctx in enumerate(contexts, 1):
+        if ctx["source"] == item["source"] and ("page" not in item or ctx["page"] == item["page"]):
+            return rank
+    return None
+
+
+class QueryEmbeddingCache:
+    """Full-size query embeddings persisted as JSON, keyed by model and question"""
+
+    def __init__(self, path):
+        self.path = path
+        self._cache = {}
+        self._dirty = False
+        if os.path.exists(path):
+            with open(path) as f:
+                self._cache = json.load(f)
+
+    def get(self, question, model):
+        key = f"{model}\n{question}"
+        if key not in self._cache:
+            self._cache[key] = embed_full(question, model=model)
+            self._dirty = True
+        return self._cache[key]
+
+    def save(self):
+        if self._dirty:
+            with open(self.path, "w") as f:
+                json.dump(self._cache, f)
+            self._dirty = False
+
+
+class SnapshotIndex:
+    """In-memory stand-in for the collection, loaded from a snapshot directory
+
+    Mirrors query_documents: cosine distance on (optionally truncated) vectors,
+    category filtering and the same adaptive auto-cut.
+    """
+
+    def __init__(self, path):
+        _require_pyarrow()
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        if not manifest["dims"]:
+            raise ValueError(f"Snapshot {path} contains no vectors")
+
+        vectors = np.memmap(
+            os.path.join(path, VECTORS_FILE),
+            dtype=np.dtype(manifest["vector_dtype"]).newbyteorder("<"),
+            mode="r",
+            shape=(manifest["count"], manifest["dims"]),
+        )
+        # Snapshots record the model their vectors came from (older ones don't)
+        self.embedding_model = (manifest.get("index") or {}).get("embedding_model")
+
+        columns = ["has_vector", "uuid", "text", "source", "page", "policy_category", "last_updated"]
+        table = pq.read_table(os.path.join(path, METADATA_FILE), columns=columns).to_pydict()
+        # Duplicate links (see dedupe.py) have no vector and are never search hits
+        keep = np.asarray(table["has_vector"], dtype=bool)
+        self.vectors = np.asarray(vectors[keep], dtype=np.float32)
+        self.records = [
+            {name: table[name][i] for name in columns[1:]}
+            for i in np.flatnonzero(keep)
+        ]
+        self.categories = np.asarray([record["policy_category"] or "General" for record in self.records])
+        self._truncated = {}
+
+    def _matrix(self, dim):
+        """Stored vectors truncated to ``dim`` and normalized, computed once per dim"""
+        dim = dim if dim and dim < self.vectors.shape[1] else 0
+        if dim not in self._truncated:
+            matrix = self.vectors[:, :dim] if dim else self.vectors
+            self._truncated[dim] = matrix / (np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-12)
+        return self._truncated[dim]
+
+    def search(self, query_full, category=None, limit=5, adaptive=False, dim=None):
+        matrix = self._matrix(dim)
+        query = np.asarray(truncate_embedding(query_full, dim), dtype=np.float32)[:matrix.shape[1]]
+        distances = 1.0 - matrix @ (query / (np.linalg.norm(query) + 1e-12))
+        if category and category != "All Categories":
+            distances = np.where(self.categories == category, distances, np.inf)
+
+        top_k = RETRIEVAL_MAX_K if adaptive else limit
+        order = np.argsort(distances)[:top_k]
+        order = order[np.isfinite(distances[order])]
+        if adaptive:
+            order = order[:autocut(distances[order])]
+        return [dict(self.records[i], distance=float(distances[i])) for i in order]
+
+
+def config_grid(args):
+    """Expand the swept options into a de-duplicated list of configurations"""
+    configs = []
+    for adaptive, limit, dim, compression in itertools.product(
+        args.adaptive, args.limit, args.dim, args.compression
+    ):
+        config = {
+            "adaptive": adaptive == "on",
+            # The fixed limit doesn't apply in adaptive mode
+            "limit": None if adaptive == "on" else limit,
+            "dim": dim,
+            "compression": compression == "on",
+        }
+        if config not in configs:
+            configs.append(config)
+    return configs
+
+
+def evaluate_config(golden, retrieve, config, model):
+    """Run every golden question through ``retrieve`` under one configuration
+
+    Returns:
+        dict: Aggregated metrics for the configuration
+    """
+    latencies, reciprocal_ranks, prompt_tokens, returned = [], [], [], []
+    hits = 0
+    for item in golden:
+        started = time.perf_counter()
+        contexts = retrieve(item, config)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+        rank = first_hit_rank(contexts, item)
+        hits += rank is not None
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+        returned.append(len(contexts))
+
+        if config["compression"] and contexts:
+            contexts = compress_contexts(item["question"], contexts, model=model)
+        prompt_tokens.append(estimate_tokens(build_rag_prompt(item["question"], contexts)))
+
+    return dict(
+        config,
+        recall=hits / len(golden),
+        mrr=float(np.mean(reciprocal_ranks)),
+        p50_ms=float(np.percentile(latencies, 50)),
+        p95_ms=float(np.percentile(latencies, 95)),
+        avg_k=float(np.mean(returned)),
+        prompt_tokens=float(np.mean(prompt_tokens)),
+    )
+
+
+def format_table(results):
+    """Render results as a Markdown table"""
+    header = ["adaptive", "limit", "dim", "compression", "recall@k", "MRR", "avg k",
+              "p50 ms", "p95 ms", "prompt tokens"]
+    rows = []
+    for result in results:
+        rows.append([
+            "on" if result["adaptive"] else "off",
+            "-" if result["limit"] is None else str(result["limit"]),
+            str(result["dim"] or "full"),
+            "on" if result["compression"] else "off",
+            f"{result['recall']:.1%}",
+            f"{result['mrr']:.3f}",
+            f"{result['avg_k']:.1f}",
+            f"{result['p50_ms']:.2f}",
+            f"{result['p95_ms']:.2f}",
+            f"{result['prompt_tokens']:.0f}",
+        ])
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    lines = ["| " + " | ".join(cell.ljust(width) for cell, width in zip(header, widths)) + " |",
+             "|" + "|".join("-" * (width + 2) for width in widths) + "|"]
+    lines += ["| " + " | ".join(cell.ljust(width) for cell, width in zip(row, widths)) + " |" for row in rows]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality and latency on a golden set")
+    parser.add_argument("golden", help="JSONL file of {question, source, page?, category?}")
+    parser.add_argument("--backend", choices=["weaviate", "snapshot"], default="weaviate")
+    parser.add_argument("--snapshot", help="Snapshot directory for the snapshot backend")
+    parser.add_argument("--collection", help="Collection for the weaviate backend (default: the active index)")
+    parser.add_argument("--model", help="Embedding model (default: the collection's or snapshot's, or EMBEDDING_MODEL)")
+    parser.add_argument("--limit", type=int, nargs="+", default=[5], help="Fixed top-k values to sweep")
+    parser.add_argument("--adaptive", choices=["on", "off"], nargs="+", default=["off"])
+    parser.add_argument("--dim", type=int, nargs="+",
+                        help="Embedding truncations to sweep (snapshot backend, 0 = full); with the weaviate "
+                             "backend a single value, only needed for collections whose settings aren't recorded")
+    parser.add_argument("--compression", choices=["on", "off"], nargs="+", default=["off"])
+    parser.add_argument("--embedding-cache", help="Query embedding cache file (snapshot backend)")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    golden = load_golden_set(args.golden)
+    if not golden:
+        parser.error("The golden set is empty")
+
+    client = None
+    cache = None
+    try:
+        if args.backend == "weaviate":
+            from vectorstore import connect_weaviate, initialize_collection, get_active_index, index_for_collection
+
+            if args.dim and len(args.dim) > 1:
+                parser.error("--dim can only be swept with the snapshot backend; "
+                             "a Weaviate collection is searched at the dimension it was built with")
+            client = connect_weaviate()
+            name = args.collection or get_active_index(client, refresh=True).collection
+            # The active index or a migration's shadow collection know their own model and dimension
+            index = index_for_collection(client, name)
+            if index is None and not (args.model and args.dim):
+                parser.error(f"{name} is neither the active index nor a migration target; "
+                             "pass the --model and --dim it was built with")
+            collection = initialize_collection(client, name)
+            model = args.model or index.embedding_model
+            args.dim = args.dim or [index.embedding_dim or 0]
+
+            def retrieve(item, config):
+                return query_documents(collection, item["question"], category=item.get("category"),
+                                       limit=config["limit"] or 5, adaptive=config["adaptive"],
+                                       model=model, dim=config["dim"], log=False)
+        else:
+            if not args.snapshot:
+                parser.error("--snapshot is required with the snapshot backend")
+            index = SnapshotIndex(args.snapshot)
+            model = args.model or index.embedding_model or EMBEDDING_MODEL
+            args.dim = args.dim or [0]
+            cache = QueryEmbeddingCache(args.embedding_cache or state_path("eval_query_embeddings.json"))
+            # Embed every question up front so latency only measures the search
+            for item in golden:
+                cache.get(item["question"], model)
+            cache.save()
+
+            def retrieve(item, config):
+                return index.search(cache.get(item["question"], model), category=item.get("category"),
+                                    limit=config["limit"] or 5, adaptive=config["adaptive"], dim=config["dim"])
+
+        results = []
+        for config in config_grid(args):
+            # Start each configuration cold so earlier ones don't make its fetches look cheaper
+            chunk_cache.clear()
+            results.append(evaluate_config(golden, retrieve, config, model))
+            print(f"Evaluated {len(results)} configuration(s)", file=sys.stderr)
+    finally:
+        if cache is not None:
+            cache.save()
+        if client is not None:
+            client.close()
+
+    print(format_table(results))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"golden_set": args.golden, "backend": args.backend, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,44 @@
+from collections import deque
+
+
+class HumanMessage:
+    """A message written by the user"""
+
+    def __init__(self, content):
+        self.content = content
+
+
+class AIMessage:
+    """A message written by the assistant"""
+
+    def __init__(self, content):
+        self.content = content
+
+
+class WindowMemory:
+    """Conversation memory keeping only the last ``k`` exchanges
+
+    A lightweight stand-in for LangChain's ConversationBufferWindowMemory with the
+    same ``load_memory_variables`` / ``save_context`` / ``clear`` interface, so the
+    assistant doesn't need to import LangChain at startup.
+    """
+
+    def __init__(self, k=5):
+        self.k = k
+        self._exchanges = deque()
+
+    def save_context(self, inputs, outputs):
+        """Store one exchange, e.g. save_context({"input": q}, {"output": a})"""
+        self._exchanges.append((HumanMessage(inputs["input"]), AIMessage(outputs["output"])))
+        while len(self._exchanges) > self.k:
+            self._exchanges.popleft()
+
+    def load_memory_variables(self, inputs=None):
+        """Return {"history": [HumanMessage, AIMessage, ...]} for the window"""
+        history = []
+        for human, ai in list(self._exchanges)[-self.k:] if self.k else []:
+            history.extend((human, ai))
+        return {"history": history}
+
+    def clear(self):
+        self._exchanges.clear()
@@ -0,0 +1,275 @@
+"""Zero-downtime migration of the policy index to another embedding model
+
+The workflow re-embeds the chunk text already stored in the active collection
+into a shadow collection, checks retrieval quality on a sample and then flips
+the active-index pointer that app.py and upload.py read, so the assistant keeps
+answering from the old index the whole time.
+
+Usage:
+    python migrate.py start --target hr_policies_v2 --model all-minilm --dim 256
+    python migrate.py validate --target hr_policies_v2
+    python migrate.py switch --target hr_policies_v2
+    python migrate.py status
+
+``start`` is resumable: progress is checkpointed after every page, so it can be
+interrupted and run again. ``switch`` first marks the old collection as
+draining, which makes upload.py refuse new files for it, waits until every
+writer has seen that, and copies chunks that were added or removed in the old
+collection while the migration was running. After the pointer flips it waits
+for cached pointers to expire and catches up once more before writes resume.
+"""
+
+import argparse
+import random
+import sys
+import time
+import uuid as uuid_lib
+
+import numpy as np
+import weaviate.classes as wvc
+
+from embeddings import embed_batch, truncate_embedding, EMBEDDING_RESCORE
+from retrieval import query_documents
+from vectorstore import (
+    ActiveIndex,
+    connect_weaviate,
+    initialize_collection,
+    is_partitioned,
+    get_active_index,
+    set_active_index,
+    get_config_value,
+    set_config_value,
+    migration_key,
+    DRAINING_KEY,
+    POINTER_TTL_SECONDS,
+)
+
+
+def _copy_objects(target, objects, model, dim):
+    """Re-embed a page of source objects and write them to the target under the same UUIDs"""
+    embeddable = [obj for obj in objects if not obj.properties.get("duplicate_of")]
+    vectors = embed_batch([obj.properties["text"] for obj in embeddable], model=model) if embeddable else []
+    full_vectors = {obj.uuid: vector for obj, vector in zip(embeddable, vectors)}
+
+    with target.batch.fixed_size(batch_size=len(objects)) as batch:
+        for obj in objects:
+            properties = {name: value for name, value in obj.properties.items() if value is not None}
+            properties.pop("full_vector", None)
+            full = full_vectors.get(obj.uuid)
+            vector = None
+            if full is not None:
+                vector = truncate_embedding(full.tolist(), dim)
+                if EMBEDDING_RESCORE:
+                    properties["full_vector"] = full.tolist()
+            # Duplicate links (see dedupe.py) stay vectorless in the new index too
+            batch.add_object(properties=properties, uuid=obj.uuid, vector=vector)
+    failed = target.batch.failed_objects
+    if failed:
+        raise RuntimeError(f"{len(failed)} objects failed to copy, e.g. {failed[0].message}")
+
+
+def run_copy(client, target_name, model, dim, page_size=50, rate=None):
+    """Copy (or resume copying) the active collection into the shadow collection
+
+    Args:
+        rate: Maximum embeddings per second, so the migration doesn't starve
+            interactive traffic on the shared Ollama instance
+    """
+    active = get_active_index(client, refresh=True)
+    if active.collection == target_name:
+        raise ValueError(f"{target_name} is already the active collection")
+    source = initialize_collection(client, active.collection)
+    if is_partitioned(source):
+        raise ValueError("Partitioned collections can't be migrated yet; use snapshot.py to move them")
+    target = initialize_collection(client, target_name)
+
+    state = get_config_value(client, migration_key(target_name)) or {
+        "source": active.collection,
+        "target": target_name,
+        "embedding_model": model,
+        "embedding_dim": dim,
+        "cursor": None,
+        "copied": 0,
+        "done": False,
+    }
+    if state["source"] != active.collection or state["embedding_model"] != model or state["embedding_dim"] != dim:
+        raise ValueError("A migration into this collection with different settings already exists")
+
+    while True:
+        started = time.monotonic()
+        page = source.query.fetch_objects(limit=page_size, after=state["cursor"])
+        if not page.objects:
+            break
+        _copy_objects(target, page.objects, model, dim)
+
+        state["cursor"] = str(page.objects[-1].uuid)
+        state["copied"] += len(page.objects)
+        set_config_value(client, migration_key(target_name), state)
+        print(f"Copied {state['copied']} objects", file=sys.stderr)
+
+        if rate:
+            # Throttle to at most `rate` embeddings per second
+            remaining = len(page.objects) / rate - (time.monotonic() - started)
+            if remaining > 0:
+                time.sleep(remaining)
+
+    state["done"] = True
+    set_config_value(client, migration_key(target_name), state)
+    return state
+
+
+def sync_changes(client, target_name, model, dim, page_size=50):
+    """Catch up with chunks added to or removed from the source during the migration"""
+    state = get_config_value(client, migration_key(target_name))
+    source = initialize_collection(client, state["source"])
+    target = initialize_collection(client, target_name)
+
+    source_ids = {obj.uuid for obj in source.iterator(return_properties=[])}
+    target_ids = {obj.uuid for obj in target.iterator(return_properties=[])}
+
+    missing = list(source_ids - target_ids)
+    for start in range(0, len(missing), page_size):
+        ids = missing[start:start + page_size]
+        page = source.query.fetch_objects(filters=wvc.query.Filter.by_id().contains_any(ids), limit=len(ids))
+        _copy_objects(target, page.objects, model, dim)
+
+    removed = list(target_ids - source_ids)
+    if removed:
+        target.data.delete_many(where=wvc.query.Filter.by_id().contains_any(removed))
+    return len(missing), len(removed)
+
+
+def validate(client, target_name, sample_size=50, k=5, seed=None):
+    """Compare self-retrieval recall of the old and new index on a sample of chunks
+
+    Each sampled chunk's leading text is used as a query; recall@k is the share of
+    queries whose own chunk comes back in the top k. Overlap is the mean share of
+    top-k results both indexes agree on.
+    """
+    state = get_config_value(client, migration_key(target_name))
+    if state is None:
+        raise ValueError(f"No migration into {target_name} found")
+    active = get_active_index(client, refresh=True)
+    source = initialize_collection(client, state["source"])
+    target = initialize_collection(client, target_name)
+
+    # Start the cursor at a random UUID for a cheap pseudo-random sample
+    rng = random.Random(seed)
+    cursor = uuid_lib.UUID(int=rng.getrandbits(128))
+    objects = source.query.fetch_objects(limit=sample_size, after=cursor).objects
+    if len(objects) < sample_size:
+        objects += source.query.fetch_objects(limit=sample_size - len(objects)).objects
+    objects = [obj for obj in objects if not obj.properties.get("duplicate_of")]
+
+    old_hits, new_hits, overlaps = 0, 0, []
+    for obj in objects:
+        query = obj.properties["text"][:300]
+        old = query_documents(source, query, limit=k, adaptive=False, log=False, **active.embedding_kwargs())
+        new = query_documents(target, query, limit=k, adaptive=False, log=False,
+                              model=state["embedding_model"], dim=state["embedding_dim"])
+        expected = (obj.properties["source"], obj.properties["page"])
+        old_keys = [(ctx["source"], ctx["page"]) for ctx in old]
+        new_keys = [(ctx["source"], ctx["page"]) for ctx in new]
+        old_hits += expected in old_keys
+        new_hits += expected in new_keys
+        overlaps.append(len(set(old_keys) & set(new_keys)) / k)
+
+    count = max(len(objects), 1)
+    return {
+        "sample": len(objects),
+        "old_recall": old_hits / count,
+        "new_recall": new_hits / count,
+        "overlap": float(np.mean(overlaps)) if overlaps else 0.0,
+    }
+
+
+def switch(client, target_name, min_recall_ratio=0.95, force=False, drain_seconds=None):
+    """Drain writers, catch up, validate and atomically point readers and writers at the shadow collection
+
+    Args:
+        drain_seconds: How long to wait for writers to notice the drain and for
+            cached pointers to expire (default POINTER_TTL_SECONDS)
+    """
+    state = get_config_value(client, migration_key(target_name))
+    if state is None or not state.get("done"):
+        raise ValueError(f"Migration into {target_name} has not finished copying")
+    drain_seconds = POINTER_TTL_SECONDS if drain_seconds is None else drain_seconds
+    model, dim = state["embedding_model"], state["embedding_dim"]
+
+    set_config_value(client, DRAINING_KEY, {"collection": state["source"], "target": target_name})
+    try:
+        # Files that started before the drain finish writing to the old collection
+        print(f"Draining writers for {drain_seconds:.0f}s", file=sys.stderr)
+        time.sleep(drain_seconds)
+        added, removed = sync_changes(client, target_name, model, dim)
+        print(f"Caught up: {added} added, {removed} removed", file=sys.stderr)
+
+        if not force:
+            report = validate(client, target_name)
+            print(f"Validation: {report}", file=sys.stderr)
+            if report["new_recall"] < report["old_recall"] * min_recall_ratio:
+                raise RuntimeError("New index recall is too low; not switching (use --force to override)")
+
+        previous = get_active_index(client, refresh=True)
+        set_active_index(client, ActiveIndex(target_name, model, dim))
+        state["switched_from"] = previous._asdict()
+        set_config_value(client, migration_key(target_name), state)
+
+        # Writers may still hold the old pointer until it expires; anything that
+        # reached the old collection meanwhile is copied over
+        time.sleep(drain_seconds)
+        added, removed = sync_changes(client, target_name, model, dim)
+        print(f"Caught up after the switch: {added} added, {removed} removed", file=sys.stderr)
+    finally:
+        set_config_value(client, DRAINING_KEY, None)
+    return previous
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migrate the policy index to another embedding model")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    start_parser = subparsers.add_parser("start", help="Copy and re-embed into a shadow collection")
+    start_parser.add_argument("--target", required=True, help="Name of the shadow collection")
+    start_parser.add_argument("--model", required=True, help="New Ollama embedding model")
+    start_parser.add_argument("--dim", type=int, default=0, help="Truncated dimension (0 = full size)")
+    start_parser.add_argument("--page-size", type=int, default=50)
+    start_parser.add_argument("--rate", type=float, help="Max embeddings per second")
+
+    validate_parser = subparsers.add_parser("validate", help="Compare recall of the old and new index")
+    validate_parser.add_argument("--target", required=True)
+    validate_parser.add_argument("--sample", type=int, default=50)
+    validate_parser.add_argument("--k", type=int, default=5)
+
+    switch_parser = subparsers.add_parser("switch", help="Catch up and switch readers to the new index")
+    switch_parser.add_argument("--target", required=True)
+    switch_parser.add_argument("--min-recall-ratio", type=float, default=0.95)
+    switch_parser.add_argument("--force", action="store_true", help="Switch without validating")
+    switch_parser.add_argument("--drain-seconds", type=float,
+                               help="Wait for writers before and after the switch (default POINTER_TTL_SECONDS)")
+
+    subparsers.add_parser("status", help="Show the active index")
+    args = parser.parse_args(argv)
+
+    client = connect_weaviate()
+    try:
+        if args.command == "start":
+            state = run_copy(client, args.target, args.model, args.dim, page_size=args.page_size, rate=args.rate)
+            print(f"Copied {state['copied']} objects into {args.target}")
+        elif args.command == "validate":
+            report = validate(client, args.target, sample_size=args.sample, k=args.k)
+            print(f"Sample: {report['sample']}, recall@{args.k} old: {report['old_recall']:.2%}, "
+                  f"new: {report['new_recall']:.2%}, overlap: {report['overlap']:.2%}")
+        elif args.command == "switch":
+            previous = switch(client, args.target, min_recall_ratio=args.min_recall_ratio, force=args.force,
+                              drain_seconds=args.drain_seconds)
+            print(f"Switched from {previous.collection} to {args.target}")
+        else:
+            print(f"Active index: {get_active_index(client, refresh=True)}")
+    finally:
+        client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,44 @@
+import os
+
+from memory import HumanMessage
+
+# Ollama model used for routing and answers
+LLM_MODEL = os.environ.get("LLM_MODEL", "llama3")
+
+# Rough characters-per-token ratio of English text for Llama-family tokenizers
+CHARS_PER_TOKEN = 4
+
+
+def format_chat_history(chat_history):
+    """Render memory messages as the chat-history block of a prompt ("" when empty)"""
+    if not chat_history:
+        return ""
+    chat_history_text = "\n".join([
+        f"Human: {message.content}" if isinstance(message, HumanMessage) else f"AI: {message.content}"
+        for message in chat_history
+    ])
+    return f"\nChat History:\n{chat_history_text}\n"
+
+
+def format_contexts(contexts):
+    """Render retrieved chunks with their citation metadata"""
+    return "\n\n".join([
+        f"Source: {ctx['source']}, Category: {ctx['policy_category']}, Page: {ctx['page']}, Last Updated: {ctx['last_updated']}\n{ctx['text']}"
+        for ctx in contexts
+    ])
+
+
+def build_rag_prompt(query, contexts, chat_history=None):
+    """Build the augmented prompt sent to the LLM for a policy question"""
+    return f"""You are an HR Policy Assistant. Using the following company policy documents and chat history, answer the HR professional's question about company policies.
+Be concise, accurate, and helpful. If you don't know the answer based on the provided context, say you don't have enough information.
+
+Context from HR policy documents:
+{format_contexts(contexts)}
+{format_chat_history(chat_history)}
+HR professional's question: {query}"""
+
+
+def estimate_tokens(text):
+    """Approximate token count of a prompt, for budgeting and reports"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
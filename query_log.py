@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from session_store import state_path
+
+# Append-only log of retrievals (query hash, category, chunk IDs, distances, latency)
+QUERY_LOG = os.environ.get("QUERY_LOG", "1") == "1"
+# The log is rotated to query_log.jsonl.1 once it grows past this size
+QUERY_LOG_MAX_MB = float(os.environ.get("QUERY_LOG_MAX_MB", "50"))
+
+QUERY_LOG_FILE = "query_log.jsonl"
+
+_lock = threading.Lock()
+
+
+def query_hash(query):
+    """Stable, anonymous identifier of a query (case and spacing are ignored)"""
+    return hashlib.sha256(" ".join(query.lower().split()).encode("utf-8")).hexdigest()[:16]
+
+
+def log_query(query, category, collection_name, contexts, latency, cached=0, fetched=0, path=None):
+    """Append one retrieval to the query log
+
+    Args:
+        contexts: Contexts returned by query_documents
+        latency: Retrieval time in seconds, including embedding the query
+        cached, fetched: Number of chunk payloads served from the chunk cache
+            and fetched from Weaviate
+    """
+    if not QUERY_LOG:
+        return
+    entry = {
+        "ts": round(time.time(), 3),
+        "query_hash": query_hash(query),
+        "category": category or "All Categories",
+        "collection": collection_name,
+        "latency_ms": round(latency * 1000, 1),
+        "cached": cached,
+        "fetched": fetched,
+        "chunks": [
+            {"uuid": ctx["uuid"], "source": ctx["source"], "page": ctx["page"], "distance": round(ctx["distance"], 4)}
+            for ctx in contexts
+        ],
+    }
+    path = path or state_path(QUERY_LOG_FILE)
+    line = json.dumps(entry) + "\n"
+    try:
+        with _lock:
+            if QUERY_LOG_MAX_MB and os.path.exists(path) and os.path.getsize(path) > QUERY_LOG_MAX_MB * 1024 * 1024:
+                os.replace(path, path + ".1")
+            with open(path, "a") as f:
+                f.write(line)
+    except OSError as e:
+        print(f"Warning: Could not write query log: {e}")
+
+
+def read_query_log(path=None, since=None):
+    """Yield logged retrievals, oldest first, optionally only those after ``since`` (epoch seconds)"""
+    path = path or state_path(QUERY_LOG_FILE)
+    if not os.path.exists(path):
+        return
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # A partially written last line
+            if since is None or entry["ts"] >= since:
+                yield entry
+
+
+def query_log_report(path=None, since=None, limit=10):
+    """Summarize the query log: hottest documents and chunks, slowest queries
+
+    Returns:
+        dict: ``queries``, ``p50_ms``, ``p95_ms``, ``cache_ratio`` plus the lists
+        ``documents``, ``chunks`` and ``slowest`` (at most ``limit`` rows each)
+    """
+    documents = {}
+    chunks = {}
+    latencies = []
+    slowest = []
+    cached = fetched = 0
+    for entry in read_query_log(path, since):
+        latencies.append(entry["latency_ms"])
+        slowest.append(entry)
+        if len(slowest) > limit * 4:
+            slowest = sorted(slowest, key=lambda e: -e["latency_ms"])[:limit]
+        cached += entry.get("cached", 0)
+        fetched += entry.get("fetched", 0)
+
+        for source in {chunk["source"] for chunk in entry["chunks"]}:
+            documents.setdefault(source, {"Document": source, "Queries": 0, "Chunk Hits": 0})["Queries"] += 1
+        for chunk in entry["chunks"]:
+            documents[chunk["source"]]["Chunk Hits"] += 1
+            row = chunks.setdefault(chunk["uuid"], {
+                "Document": chunk["source"], "Page": chunk["page"], "Hits": 0, "distances": [],
+            })
+            row["Hits"] += 1
+            row["distances"].append(chunk["distance"])
+
+    for row in chunks.values():
+        row["Avg Distance"] = round(float(np.mean(row.pop("distances"))), 3)
+
+    return {
+        "queries": len(latencies),
+        "p50_ms": float(np.percentile(latencies, 50)) if latencies else 0.0,
+        "p95_ms": float(np.percentile(latencies, 95)) if latencies else 0.0,
+        # Share of chunk payloads served from the chunk cache instead of Weaviate
+        "cache_ratio": cached / (cached + fetched) if cached + fetched else 0.0,
+        "documents": sorted(documents.values(), key=lambda row: (-row["Queries"], -row["Chunk Hits"]))[:limit],
+        "chunks": sorted(chunks.values(), key=lambda row: -row["Hits"])[:limit],
+        "slowest": [
+            {
+                "Time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["ts"])),
+                "Query": entry["query_hash"],
+                "Category": entry["category"],
+                "Latency (ms)": entry["latency_ms"],
+                "Chunks": len(entry["chunks"]),
+            }
+            for entry in sorted(slowest, key=lambda e: -e["latency_ms"])[:limit]
+        ],
+    }
@@ -0,0 +1,287 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import weaviate.classes as wvc
+
+from embeddings import embed_for_index, rescore_by_full_vector, EMBEDDING_RESCORE, RESCORE_SHORTLIST_FACTOR
+from vectorstore import is_partitioned, partition, partitions
+from query_log import log_query
+
+# Adaptive top-k: fetch up to RETRIEVAL_MAX_K hits and cut at the largest score jump
+RETRIEVAL_ADAPTIVE = os.environ.get("RETRIEVAL_ADAPTIVE", "1") == "1"
+RETRIEVAL_MIN_K = int(os.environ.get("RETRIEVAL_MIN_K", "1"))
+RETRIEVAL_MAX_K = int(os.environ.get("RETRIEVAL_MAX_K", "8"))
+# Hits farther than this cosine distance are never returned (unset = no threshold)
+RETRIEVAL_MAX_DISTANCE = float(os.environ.get("RETRIEVAL_MAX_DISTANCE", "0")) or None
+# Smallest distance gap that counts as a jump worth cutting at
+AUTOCUT_MIN_JUMP = float(os.environ.get("AUTOCUT_MIN_JUMP", "0.03"))
+
+CONTEXT_PROPERTIES = ["text", "source", "page", "policy_category", "last_updated"]
+
+# Chunk payloads (text, metadata, full vector) kept in memory per process; with the
+# cache on, searches only return IDs and distances (0 disables the cache)
+CHUNK_CACHE_SIZE = int(os.environ.get("CHUNK_CACHE_SIZE", "2048"))
+
+# Fan-out pool for searching every partition of a partitioned collection
+_fanout_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("PARTITION_FANOUT_WORKERS", "8")),
+    thread_name_prefix="partition-search",
+)
+
+
+class ChunkCache:
+    """Thread-safe LRU cache of chunk payloads keyed by (collection, UUID)
+
+    Chunks are never modified in place (re-ingesting creates new UUIDs), so
+    entries don't need invalidation; deleted chunks simply stop being returned
+    by searches and age out.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get_many(self, collection_name, uuids):
+        """Cached payloads for the UUIDs that are present, marking them recently used"""
+        found = {}
+        with self._lock:
+            for uuid in uuids:
+                payload = self._entries.get((collection_name, uuid))
+                if payload is not None:
+                    self._entries.move_to_end((collection_name, uuid))
+                    found[uuid] = payload
+            self.hits += len(found)
+            self.misses += len(uuids) - len(found)
+        return found
+
+    def put_many(self, collection_name, payloads):
+        with self._lock:
+            for uuid, payload in payloads.items():
+                self._entries[(collection_name, uuid)] = payload
+                self._entries.move_to_end((collection_name, uuid))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+chunk_cache = ChunkCache(CHUNK_CACHE_SIZE)
+
+
+def autocut(distances, min_k=None, max_k=None, max_distance=None, min_jump=None):
+    """Decide how many of the (ascending) distances to keep
+
+    Hits beyond ``max_distance`` are dropped first, so the result may be zero when
+    nothing is relevant. Among the remaining (at most ``max_k``) hits, the list is
+    cut at the largest gap between consecutive distances, provided the gap is at
+    least ``min_jump`` and at least ``min_k`` hits are kept.
+
+    Returns:
+        int: Number of leading hits to keep
+    """
+    min_k = RETRIEVAL_MIN_K if min_k is None else min_k
+    max_k = RETRIEVAL_MAX_K if max_k is None else max_k
+    max_distance = RETRIEVAL_MAX_DISTANCE if max_distance is None else max_distance
+    min_jump = AUTOCUT_MIN_JUMP if min_jump is None else min_jump
+
+    distances = np.asarray(distances, dtype=np.float64)[:max_k]
+    if max_distance is not None:
+        distances = distances[distances <= max_distance]
+    count = len(distances)
+    if count <= max(min_k, 1):
+        return count
+
+    gaps = np.diff(distances)
+    # gaps[i] separates hit i from hit i + 1; cutting there keeps i + 1 hits
+    start = max(min_k, 1) - 1
+    best = start + int(np.argmax(gaps[start:]))
+    if gaps[best] >= min_jump:
+        return best + 1
+    return count
+
+
+# Function to perform RAG query
+def query_documents(collection, query, category=None, limit=5, adaptive=None, model=None, dim=None, log=True):
+    """Embed the query and return the most relevant policy chunks
+
+    Args:
+        collection: Weaviate collection
+        query: The user's question
+        category: Optional policy category filter ("All Categories" = no filter)
+        limit: Number of chunks to return in fixed mode
+        adaptive: Use distance-based auto-cut between RETRIEVAL_MIN_K and
+            RETRIEVAL_MAX_K instead of a fixed limit (default RETRIEVAL_ADAPTIVE)
+        model, dim: Embedding model and truncation the collection was built with
+            (see ActiveIndex.embedding_kwargs)
+        log: Record the retrieval in the query log (off for offline tools); a
+            callable is called with log_query's arguments instead, e.g. to log a
+            speculative retrieval only once it is used
+
+    Returns:
+        list: Context dicts with text, citation metadata and distance; may be
+        empty when nothing is relevant enough
+    """
+    started = time.perf_counter()
+    adaptive = RETRIEVAL_ADAPTIVE if adaptive is None else adaptive
+    top_k = RETRIEVAL_MAX_K if adaptive else limit
+    shortlist = top_k * RESCORE_SHORTLIST_FACTOR if EMBEDDING_RESCORE else top_k
+
+    # Query vector is embedded and truncated exactly like the stored vectors
+    query_vector, query_full = embed_for_index(query, model=model, dim=dim)
+
+    def search(handle, filters=None):
+        objects = handle.query.near_vector(
+            near_vector=query_vector,
+            filters=filters,
+            limit=shortlist,
+            return_properties=search_properties(),
+            return_metadata=wvc.query.MetadataQuery(distance=True),
+        ).objects
+        return [(handle.tenant, obj) for obj in objects]
+
+    filtered = bool(category and category != "All Categories")
+    if not is_partitioned(collection):
+        filters = wvc.query.Filter.by_property("policy_category").equal(category) if filtered else None
+        results = search(collection, filters)
+    elif filtered:
+        # Only the category's own partition is searched
+        handle = partition(collection, category)
+        results = search(handle) if handle is not None else []
+    else:
+        # Search every active partition in parallel and merge by distance
+        results = [hit for result in _fanout_executor.map(search, partitions(collection)) for hit in result]
+        results.sort(key=lambda hit: hit[1].metadata.distance)
+        results = results[:shortlist]
+
+    # Fill in chunk payloads from the cache, fetching only the missing ones
+    payloads, missing = cached_payloads(collection.name, results)
+    cached = len(payloads) if chunk_cache.enabled else 0
+    fetched = {}
+    for tenant, uuids in missing.items():
+        handle = collection.with_tenant(tenant) if tenant else collection
+        fetched.update(fetch_payloads(handle, uuids))
+    chunk_cache.put_many(collection.name, fetched)
+    payloads.update(fetched)
+
+    contexts = rank_results(results, payloads, query_full, top_k, adaptive)
+    if log:
+        record = log if callable(log) else log_query
+        record(query, category, collection.name, contexts, time.perf_counter() - started,
+               cached=cached, fetched=len(payloads) - cached)
+    return contexts
+
+
+def payload_properties():
+    """Chunk properties needed to build a context"""
+    if EMBEDDING_RESCORE:
+        # Shortlist on the small vectors, then rescore with the full embeddings
+        return CONTEXT_PROPERTIES + ["full_vector"]
+    return list(CONTEXT_PROPERTIES)
+
+
+def search_properties():
+    """Properties fetched with each search hit; none when payloads come from the chunk cache"""
+    return [] if chunk_cache.enabled else payload_properties()
+
+
+def cached_payloads(collection_name, results):
+    """Resolve the payloads of search hits that are already known
+
+    Args:
+        results: (tenant, object) pairs returned by the searches
+
+    Returns:
+        tuple: ({uuid: properties} for known hits, {tenant: [uuid, ...]} still to fetch)
+    """
+    if not chunk_cache.enabled:
+        # Searches returned the properties themselves
+        return {obj.uuid: obj.properties for _, obj in results}, {}
+    payloads = chunk_cache.get_many(collection_name, [obj.uuid for _, obj in results])
+    missing = {}
+    for tenant, obj in results:
+        if obj.uuid not in payloads:
+            missing.setdefault(tenant, []).append(obj.uuid)
+    return payloads, missing
+
+
+def payload_filter(uuids):
+    return wvc.query.Filter.by_id().contains_any(list(uuids))
+
+
+def fetch_payloads(handle, uuids):
+    """Fetch the payloads of chunks by UUID in one request"""
+    result = handle.query.fetch_objects(
+        filters=payload_filter(uuids),
+        limit=len(uuids),
+        return_properties=payload_properties(),
+    )
+    return {obj.uuid: obj.properties for obj in result.objects}
+
+
+def rank_results(results, payloads, query_full, top_k, adaptive):
+    """Turn shortlisted search hits into the final, ranked context dicts
+
+    Applies full-vector rescoring (EMBEDDING_RESCORE) and the adaptive auto-cut.
+    Shared by the blocking and the async retrieval paths.
+
+    Args:
+        results: (tenant, object) pairs from the searches, best first
+        payloads: {uuid: properties} for the hits; hits without a payload
+            (deleted since the search) are dropped
+    """
+    hits = [(obj, payloads[obj.uuid]) for _, obj in results if obj.uuid in payloads]
+    if EMBEDDING_RESCORE:
+        ranked = rescore_by_full_vector(
+            query_full,
+            [((obj, properties), properties.get("full_vector")) for obj, properties in hits],
+            top_k,
+        )
+        # Chunks without a stored full vector keep their shortlist distance
+        hits = [(obj, properties, obj.metadata.distance if distance is None else distance)
+                for (obj, properties), distance in ranked]
+    else:
+        hits = [(obj, properties, obj.metadata.distance) for obj, properties in hits]
+    # Rescoring appends chunks without a full vector at the end; auto-cut needs ascending distances
+    hits.sort(key=lambda hit: hit[2])
+
+    if adaptive:
+        hits = hits[:autocut([distance for _, _, distance in hits])]
+
+    contexts = []
+    for obj, properties, distance in hits:
+        contexts.append({
+            "uuid": str(obj.uuid),
+            "text": properties["text"],
+            "source": properties["source"],
+            "page": properties["page"],
+            "policy_category": properties.get("policy_category", "General"),
+            "last_updated": properties.get("last_updated", ""),
+            "distance": distance
+        })
+
+    return contexts
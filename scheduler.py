@@ -0,0 +1,241 @@
+import os
+import threading
+import time
+import itertools
+
+import ollama
+
+try:
+    import fcntl  # Only available on Unix, used for the cross-process slot lock
+except ImportError:
+    fcntl = None
+
+# Priority classes for queued generations (lower value is served first)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+
+# General-conversation prompts shorter than this are treated as interactive
+SHORT_PROMPT_CHARS = 500
+
+
+class SchedulerBusyError(Exception):
+    """Raised when a generation cannot be admitted (queue full or wait too long)"""
+
+
+class _FileSlots:
+    """Cross-process concurrency slots backed by lock files in a shared directory
+
+    Every process that points at the same directory competes for the same
+    ``count`` slots, so several Streamlit workers (or replicas sharing a volume)
+    respect one global limit on concurrent Ollama generations.
+    """
+
+    def __init__(self, directory, count):
+        self.directory = directory
+        self.count = count
+        os.makedirs(directory, exist_ok=True)
+
+    def try_acquire(self):
+        """Return an open lock file handle for a free slot, or None if all are taken"""
+        for slot in range(self.count):
+            handle = open(os.path.join(self.directory, f"slot-{slot}.lock"), "a+")
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return handle
+            except OSError:
+                handle.close()
+        return None
+
+    @staticmethod
+    def release(handle):
+        try:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+        finally:
+            handle.close()
+
+
+class _Ticket:
+    def __init__(self, seq, user_id, priority):
+        self.seq = seq
+        self.user_id = user_id
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+
+
+class GenerationScheduler:
+    """Admission control and fair queueing for LLM generations
+
+    A single instance is shared by every Streamlit session in the process. At most
+    ``max_concurrency`` generations run at once; waiting requests are ordered by
+    priority class first, then by how many generations their user already has in
+    flight and how recently that user was served, so one busy user cannot starve
+    the others. When the queue is full or a request waits longer than ``max_wait``
+    seconds it is rejected with ``SchedulerBusyError`` instead of piling up.
+    """
+
+    def __init__(self, max_concurrency=2, max_queue=50, max_wait=120.0, slot_dir=None,
+                 poll_interval=0.5):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.file_slots = _FileSlots(slot_dir, max_concurrency) if slot_dir and fcntl else None
+
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._waiting = []
+        self._active = 0
+        self._active_by_user = {}
+        self._last_served = {}
+        self._last_pruned = time.monotonic()
+        self._stats = {"admitted": 0, "rejected": 0, "timed_out": 0, "total_wait": 0.0, "max_wait": 0.0}
+
+    def _order_key(self, ticket):
+        return (
+            ticket.priority,
+            self._active_by_user.get(ticket.user_id, 0),
+            self._last_served.get(ticket.user_id, 0.0),
+            ticket.seq,
+        )
+
+    def _prune_last_served(self, now):
+        """Forget users who have been idle for longer than ``max_wait``
+
+        Their ``last_served`` time can no longer change the order of any waiting
+        request (every request queued that long ago has timed out), and an unknown
+        user is ordered as "served long ago", so dropping them keeps the dict from
+        growing with every session the process has seen. Call with the lock held.
+        """
+        if now - self._last_pruned < self.max_wait:
+            return
+        self._last_pruned = now
+        busy = {ticket.user_id for ticket in self._waiting} | set(self._active_by_user)
+        for user_id, served in list(self._last_served.items()):
+            if user_id not in busy and now - served > self.max_wait:
+                del self._last_served[user_id]
+
+    def _position(self, ticket):
+        """1-based position of the ticket among the waiting requests"""
+        key = self._order_key(ticket)
+        return 1 + sum(1 for other in self._waiting if self._order_key(other) < key)
+
+    def acquire(self, user_id, priority=PRIORITY_NORMAL, on_wait=None):
+        """Block until a generation slot is granted and return a release callback
+
+        Args:
+            user_id: Identifier used for per-user fairness (e.g. the session id)
+            priority: PRIORITY_INTERACTIVE or PRIORITY_NORMAL
+            on_wait: Optional callable(position, waited_seconds) invoked while queued
+
+        Returns:
+            callable: Function that releases the slot; call it exactly once
+        """
+        with self._cond:
+            if len(self._waiting) >= self.max_queue:
+                self._stats["rejected"] += 1
+                raise SchedulerBusyError("The assistant is at capacity right now. Please try again in a moment.")
+            ticket = _Ticket(next(self._seq), user_id, priority)
+            self._waiting.append(ticket)
+
+            file_handle = None
+            try:
+                while True:
+                    waited = time.monotonic() - ticket.enqueued_at
+                    position = self._position(ticket)
+                    if position == 1 and self._active < self.max_concurrency:
+                        if self.file_slots is None:
+                            break
+                        file_handle = self.file_slots.try_acquire()
+                        if file_handle is not None:
+                            break
+                    if waited > self.max_wait:
+                        self._stats["timed_out"] += 1
+                        raise SchedulerBusyError("Timed out waiting for a free model slot. Please try again.")
+                    if on_wait is not None:
+                        # Release the lock while the callback touches the UI
+                        self._cond.release()
+                        try:
+                            on_wait(position, waited)
+                        finally:
+                            self._cond.acquire()
+                    self._cond.wait(self.poll_interval)
+            finally:
+                self._waiting.remove(ticket)
+                # Our departure may change who is at the head of the queue
+                self._cond.notify_all()
+
+            waited = time.monotonic() - ticket.enqueued_at
+            self._active += 1
+            self._active_by_user[user_id] = self._active_by_user.get(user_id, 0) + 1
+            self._last_served[user_id] = time.monotonic()
+            self._stats["admitted"] += 1
+            self._stats["total_wait"] += waited
+            self._stats["max_wait"] = max(self._stats["max_wait"], waited)
+
+        released = threading.Event()
+
+        def release():
+            if released.is_set():
+                return
+            released.set()
+            if file_handle is not None:
+                _FileSlots.release(file_handle)
+            with self._cond:
+                self._active -= 1
+                remaining = self._active_by_user.get(user_id, 1) - 1
+                if remaining > 0:
+                    self._active_by_user[user_id] = remaining
+                else:
+                    self._active_by_user.pop(user_id, None)
+                self._prune_last_served(time.monotonic())
+                self._cond.notify_all()
+
+        return release
+
+    def generate(self, user_id, priority=PRIORITY_NORMAL, on_wait=None, **kwargs):
+        """Run ``ollama.generate(**kwargs)`` once a slot has been granted"""
+        release = self.acquire(user_id, priority=priority, on_wait=on_wait)
+        try:
+            return ollama.generate(**kwargs)
+        finally:
+            release()
+
+    def stats(self):
+        """Snapshot of queue depth, running generations and wait statistics"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats["queued"] = len(self._waiting)
+            stats["running"] = self._active
+            stats["avg_wait"] = stats["total_wait"] / stats["admitted"] if stats["admitted"] else 0.0
+            return stats
+
+
+def priority_for(kind, prompt):
+    """Pick a priority class for a generation request
+
+    Tool routing and short general-conversation prompts are cheap and on the
+    interactive path, so they jump ahead of long RAG generations.
+    """
+    if kind == "routing":
+        return PRIORITY_INTERACTIVE
+    if kind == "general" and len(prompt) <= SHORT_PROMPT_CHARS:
+        return PRIORITY_INTERACTIVE
+    return PRIORITY_NORMAL
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Return the process-wide scheduler, configured from environment variables"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = GenerationScheduler(
+                max_concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY", "2")),
+                max_queue=int(os.environ.get("LLM_MAX_QUEUE", "50")),
+                max_wait=float(os.environ.get("LLM_MAX_WAIT_SECONDS", "120")),
+                slot_dir=os.environ.get("LLM_SLOT_DIR") or None,
+            )
+        return _scheduler
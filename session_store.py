@@ -0,0 +1,113 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Directory for local persistent state (chat history, logs, caches)
+STATE_DIR = os.environ.get("RAG_STATE_DIR", "rag_state")
+
+# Messages kept in memory per session; older ones are paged in from SQLite
+SESSION_WINDOW = int(os.environ.get("SESSION_WINDOW", "20"))
+HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", "20"))
+
+
+def state_path(name):
+    """Path of a file inside the state directory, creating the directory if needed"""
+    os.makedirs(STATE_DIR, exist_ok=True)
+    return os.path.join(STATE_DIR, name)
+
+
+def source_refs(contexts):
+    """Reduce retrieved contexts to references: chunk UUID plus citation metadata
+
+    The chunk text itself is not copied; it can be loaded again by UUID.
+    """
+    refs = []
+    for ctx in contexts or []:
+        refs.append({
+            "uuid": ctx.get("uuid"),
+            "source": ctx["source"],
+            "page": ctx["page"],
+            "policy_category": ctx.get("policy_category", "General"),
+            "last_updated": str(ctx.get("last_updated", "")),
+        })
+    return refs
+
+
+class SessionStore:
+    """SQLite-backed store for chat conversations
+
+    One connection is shared by every session in the process; writes are
+    serialized with a lock and the database runs in WAL mode so readers don't
+    block writers.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or state_path("sessions.db")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    conversation_id TEXT NOT NULL,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    sources TEXT,
+                    created_at REAL NOT NULL
+                )"""
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (conversation_id, id)"
+            )
+
+    @staticmethod
+    def _to_message(row):
+        message = {"id": row["id"], "role": row["role"], "content": row["content"]}
+        if row["sources"]:
+            message["sources"] = json.loads(row["sources"])
+        return message
+
+    def append(self, conversation_id, role, content, sources=None):
+        """Persist a message and return it in the in-memory message format"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO messages (conversation_id, role, content, sources, created_at) VALUES (?, ?, ?, ?, ?)",
+                (conversation_id, role, content, json.dumps(sources) if sources else None, time.time()),
+            )
+        message = {"id": cursor.lastrowid, "role": role, "content": content}
+        if sources:
+            message["sources"] = sources
+        return message
+
+    def recent(self, conversation_id, limit=SESSION_WINDOW):
+        """The latest ``limit`` messages, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM messages WHERE conversation_id = ? ORDER BY id DESC LIMIT ?",
+                (conversation_id, limit),
+            ).fetchall()
+        return [self._to_message(row) for row in reversed(rows)]
+
+    def before(self, conversation_id, before_id, limit=HISTORY_PAGE_SIZE):
+        """Up to ``limit`` messages older than ``before_id``, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM messages WHERE conversation_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                (conversation_id, before_id, limit),
+            ).fetchall()
+        return [self._to_message(row) for row in reversed(rows)]
+
+    def count_before(self, conversation_id, before_id):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE conversation_id = ? AND id < ?",
+                (conversation_id, before_id),
+            ).fetchone()[0]
+
+    def clear(self, conversation_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
@@ -0,0 +1,301 @@
+"""Export and import compact snapshots of the indexed policy corpus
+
+A snapshot is a directory containing:
+
+- ``manifest.json``: collection name, embedding model and truncation, object
+  count, vector size and schema
+- ``vectors.bin``: one fixed-size row per object (float16 by default)
+- ``metadata.parquet``: UUIDs, tenant (partitioned layout), a has_vector flag and
+  every stored property
+
+Objects are streamed from Weaviate page by page with the cursor API and loaded
+back with batched inserts, so a restore never calls Ollama. A snapshot is only
+imported into a collection searched with the same embedding model and
+truncation; restoring into an empty environment points the active index at it.
+
+Usage:
+    python snapshot.py export ./snapshots/2025-05-23
+    python snapshot.py import ./snapshots/2025-05-23
+"""
+
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from vectorstore import (
+    ActiveIndex,
+    connect_weaviate,
+    initialize_collection,
+    is_partitioned,
+    partition,
+    partitions,
+    all_partitions,
+    get_config_value,
+    index_for_collection,
+    set_active_index,
+    ACTIVE_INDEX_KEY,
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Only needed for snapshots, not for the apps
+    pa = None
+    pq = None
+
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.bin"
+METADATA_FILE = "metadata.parquet"
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("Snapshots require pyarrow. Install it with: pip install pyarrow")
+
+
+def _arrow_type(data_type):
+    """Map a Weaviate data type name to the Arrow type used in the snapshot"""
+    return {
+        "int": pa.int64(),
+        "number": pa.float64(),
+        "boolean": pa.bool_(),
+        "number[]": pa.list_(pa.float32()),
+        "int[]": pa.list_(pa.int64()),
+        "text[]": pa.list_(pa.string()),
+    }.get(data_type, pa.string())  # text, date (ISO 8601) and anything else as strings
+
+
+def _to_column_value(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+def _object_vector(obj):
+    """Return the default vector of an object, or None if it has none"""
+    vector = obj.vector
+    if isinstance(vector, dict):
+        vector = vector.get("default")
+    return vector or None
+
+
+def export_snapshot(collection, out_dir, page_size=1000, dtype="float16", index=None):
+    """Stream every object of the collection into a snapshot directory
+
+    Args:
+        index: ActiveIndex describing how the collection was embedded, recorded
+            in the manifest so imports can check it
+
+    Returns:
+        int: Number of objects exported
+    """
+    _require_pyarrow()
+    os.makedirs(out_dir, exist_ok=True)
+
+    properties = [
+        {"name": prop.name, "data_type": prop.data_type.value}
+        for prop in collection.config.get().properties
+    ]
+    schema = pa.schema(
+        [("uuid", pa.string()), ("tenant", pa.string()), ("has_vector", pa.bool_())]
+        + [(prop["name"], _arrow_type(prop["data_type"])) for prop in properties]
+    )
+
+    count = 0
+    dims = None
+    pending = []  # Pages read before the vector size is known (leading vectorless objects)
+    writer = pq.ParquetWriter(os.path.join(out_dir, METADATA_FILE), schema, compression="zstd")
+
+    def flush(vector_file):
+        for columns, rows in pending:
+            block = np.zeros((len(rows), dims or 0), dtype=np.dtype(dtype).newbyteorder("<"))
+            for i, vector in enumerate(rows):
+                if vector is not None:
+                    block[i] = vector
+            vector_file.write(block.tobytes())
+            writer.write_table(pa.table(columns, schema=schema))
+        pending.clear()
+
+    try:
+        # Every partition is exported; offloaded ones are offloaded again afterwards
+        with open(os.path.join(out_dir, VECTORS_FILE), "wb") as vector_file, all_partitions(collection) as handles:
+            for handle in handles:
+                cursor = None
+                while True:
+                    page = handle.query.fetch_objects(limit=page_size, after=cursor, include_vector=True)
+                    if not page.objects:
+                        break
+
+                    columns = {name: [] for name in schema.names}
+                    rows = []
+                    for obj in page.objects:
+                        vector = _object_vector(obj)
+                        if vector is not None and dims is None:
+                            dims = len(vector)
+                        rows.append(vector)
+                        columns["uuid"].append(str(obj.uuid))
+                        columns["tenant"].append(handle.tenant)
+                        columns["has_vector"].append(vector is not None)
+                        for prop in properties:
+                            columns[prop["name"]].append(_to_column_value(obj.properties.get(prop["name"])))
+
+                    pending.append((columns, rows))
+                    if dims is not None:
+                        flush(vector_file)
+
+                    count += len(page.objects)
+                    cursor = page.objects[-1].uuid
+                    print(f"Exported {count} objects", file=sys.stderr)
+            flush(vector_file)
+    finally:
+        writer.close()
+
+    manifest = {
+        "collection": collection.name,
+        "index": index._asdict() if index is not None else None,
+        "count": count,
+        "dims": dims,
+        "vector_dtype": dtype,
+        "properties": properties,
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+    with open(os.path.join(out_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return count
+
+
+def read_manifest(in_dir):
+    with open(os.path.join(in_dir, MANIFEST_FILE)) as f:
+        return json.load(f)
+
+
+def _is_empty(collection):
+    return all(next(iter(handle.iterator(return_properties=[])), None) is None for handle in partitions(collection))
+
+
+def check_snapshot_index(client, collection, manifest):
+    """Make sure the snapshot's vectors can be searched in ``collection``
+
+    Restoring into an empty collection of an environment that has no
+    active-index pointer yet writes one for the snapshot's model and truncation.
+
+    Raises:
+        ValueError: If the collection is searched with another model or truncation
+    """
+    snapshot_index = manifest.get("index")
+    if snapshot_index is None:
+        print("Warning: the snapshot doesn't record its embedding model; it is not checked", file=sys.stderr)
+        return
+    model, dim = snapshot_index["embedding_model"], snapshot_index["embedding_dim"] or 0
+
+    if get_config_value(client, ACTIVE_INDEX_KEY) is None and _is_empty(collection):
+        set_active_index(client, ActiveIndex(collection.name, model, dim))
+        print(f"Active index set to {collection.name} ({model}, dim {dim or 'full'})", file=sys.stderr)
+        return
+
+    target = index_for_collection(client, collection.name)
+    if target is None:
+        raise ValueError(f"{collection.name} is neither the active index nor a migration target, "
+                         "so its embedding model is unknown")
+    if (target.embedding_model, target.embedding_dim or 0) != (model, dim):
+        raise ValueError(
+            f"The snapshot was embedded with {model} (dim {dim or 'full'}), but {collection.name} is searched "
+            f"with {target.embedding_model} (dim {target.embedding_dim or 'full'})"
+        )
+
+
+def import_snapshot(collection, in_dir, batch_size=500):
+    """Bulk-load a snapshot directory into the collection
+
+    Objects keep their original UUIDs, so re-running an import overwrites rather
+    than duplicates.
+
+    Returns:
+        int: Number of objects imported
+    """
+    _require_pyarrow()
+    manifest = read_manifest(in_dir)
+
+    count = manifest["count"]
+    if count == 0:
+        return 0
+    vectors = None
+    if manifest["dims"]:
+        vectors = np.memmap(
+            os.path.join(in_dir, VECTORS_FILE),
+            dtype=np.dtype(manifest["vector_dtype"]).newbyteorder("<"),
+            mode="r",
+            shape=(count, manifest["dims"]),
+        )
+
+    row = 0
+    failed = []
+    partitioned = is_partitioned(collection)
+    metadata = pq.ParquetFile(os.path.join(in_dir, METADATA_FILE))
+    for record_batch in metadata.iter_batches(batch_size=batch_size):
+        # Group records by tenant so each partition gets its own insert batch
+        groups = {}
+        for record in record_batch.to_pylist():
+            record["row"] = row
+            row += 1
+            tenant = record.pop("tenant", None)
+            if partitioned:
+                # Snapshots of the single layout are partitioned by category on import
+                tenant = tenant or record.get("policy_category") or "Other"
+            groups.setdefault(tenant if partitioned else None, []).append(record)
+
+        for tenant, records in groups.items():
+            target = partition(collection, tenant, create=True) if tenant else collection
+            with target.batch.fixed_size(batch_size=batch_size) as batch:
+                for record in records:
+                    index = record.pop("row")
+                    uuid = record.pop("uuid")
+                    has_vector = record.pop("has_vector")
+                    properties = {name: value for name, value in record.items() if value is not None}
+                    batch.add_object(
+                        properties=properties,
+                        uuid=uuid,
+                        vector=vectors[index].astype(np.float32).tolist() if has_vector and vectors is not None else None,
+                    )
+            failed.extend(target.batch.failed_objects)
+        print(f"Imported {row}/{count} objects", file=sys.stderr)
+
+    if failed:
+        print(f"Warning: {len(failed)} objects failed to import, e.g. {failed[0].message}", file=sys.stderr)
+    return row - len(failed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or import a snapshot of the policy corpus")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path", help="Snapshot directory")
+    parser.add_argument("--collection", help="Collection to use (default: the active index)")
+    parser.add_argument("--page-size", type=int, default=1000, help="Objects fetched per cursor page on export")
+    parser.add_argument("--batch-size", type=int, default=500, help="Objects per insert batch on import")
+    parser.add_argument("--float32", action="store_true", help="Store vectors at full precision")
+    args = parser.parse_args(argv)
+
+    client = connect_weaviate()
+    try:
+        collection = initialize_collection(client, args.collection)
+        started = time.perf_counter()
+        if args.command == "export":
+            count = export_snapshot(collection, args.path, page_size=args.page_size,
+                                    dtype="float32" if args.float32 else "float16",
+                                    index=index_for_collection(client, collection.name))
+        else:
+            check_snapshot_index(client, collection, read_manifest(args.path))
+            count = import_snapshot(collection, args.path, batch_size=args.batch_size)
+        print(f"{args.command.capitalize()}ed {count} objects in {time.perf_counter() - started:.1f}s")
+    finally:
+        client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
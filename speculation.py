@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from query_log import log_query
+
+# Shared worker pool for speculative retrievals across all sessions in the process
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("SPECULATIVE_WORKERS", "4")),
+    thread_name_prefix="speculative-retrieval",
+)
+
+_stats_lock = threading.Lock()
+_stats = {"launched": 0, "used": 0, "wasted": 0, "cancelled": 0, "wasted_seconds": 0.0}
+
+
+def _record(**increments):
+    with _stats_lock:
+        for key, value in increments.items():
+            _stats[key] += value
+
+
+class SpeculativeRetrieval:
+    """Run a retrieval in the background while the router is still deciding
+
+    The caller either claims the result with ``result()`` when the RAG tool was
+    chosen, or calls ``discard()`` when it wasn't. Discarded work is counted in
+    the process-wide speculation statistics, and only claimed retrievals are
+    written to the query log.
+
+    Args:
+        fn: Retrieval function to call, e.g. query_documents
+        collection: Weaviate collection passed through to ``fn``
+        query: The user's query, used to check the result is for the same request
+        category: Category filter the retrieval was launched with
+        submit: Optional scheduler for coroutines, e.g. async_pipeline.submit;
+            ``fn`` is then a coroutine function such as aquery_documents, and
+            discarding the retrieval cancels it even while it is running
+    """
+
+    def __init__(self, fn, collection, query, category=None, submit=None, **kwargs):
+        self.query = query
+        self.category = category
+        self._duration = None
+        self._started = None
+        self._claimed = False
+        self._discarded = False
+        self._log_entry = None
+        kwargs["log"] = self._hold_log_entry
+        if submit is None:
+            self._future = _executor.submit(self._run, fn, collection, query, category, kwargs)
+        else:
+            self._started = time.perf_counter()
+            self._future = submit(fn(collection, query, category=category, **kwargs))
+            self._future.add_done_callback(lambda _: setattr(self, "_duration", time.perf_counter() - self._started))
+        _record(launched=1)
+
+    def _run(self, fn, collection, query, category, kwargs):
+        self._started = time.perf_counter()
+        try:
+            return fn(collection, query, category=category, **kwargs)
+        finally:
+            self._duration = time.perf_counter() - self._started
+
+    def _hold_log_entry(self, *args, **kwargs):
+        self._log_entry = (args, kwargs)
+
+    def matches(self, query, category=None):
+        return self.query == query and self.category == category
+
+    def result(self, timeout=None):
+        """Claim the speculative result, waiting for it if it is still running"""
+        self._claimed = True
+        contexts = self._future.result(timeout=timeout)
+        _record(used=1)
+        if self._log_entry is not None:
+            args, kwargs = self._log_entry
+            self._log_entry = None
+            log_query(*args, **kwargs)
+        return contexts
+
+    def discard(self):
+        """Give up on the result
+
+        A retrieval that hasn't started yet (or that runs on the pipeline loop
+        and hasn't finished) is cancelled, even if it was claimed and its
+        caller stopped waiting. Time already spent on a cancelled retrieval
+        counts as wasted. Safe to call more than once.
+        """
+        if self._discarded:
+            return
+        self._discarded = True
+        if self._future.cancel():
+            if self._started is None:
+                _record(cancelled=1)
+            else:
+                _record(wasted=1, wasted_seconds=time.perf_counter() - self._started)
+            return
+        if self._claimed:
+            return
+
+        def _count_waste(future):
+            _record(wasted=1, wasted_seconds=self._duration or 0.0)
+
+        self._future.add_done_callback(_count_waste)
+
+
+def speculation_stats():
+    """Snapshot of speculative retrieval counters, including the wasted-work share"""
+    with _stats_lock:
+        stats = dict(_stats)
+    finished = stats["used"] + stats["wasted"]
+    stats["waste_ratio"] = stats["wasted"] / finished if finished else 0.0
+    return stats
@@ -0,0 +1,72 @@
+import os
+import tempfile
+import unittest
+
+from answers import AnswerStore, question_key, questions_to_precompute, ALL_CATEGORIES, COMMON_QUESTIONS
+
+
+class QuestionKeyTest(unittest.TestCase):
+    def test_trivial_variations_match(self):
+        self.assertEqual(question_key("  How many  vacation days?? "), "how many vacation days")
+        self.assertEqual(question_key("How many vacation days."), question_key("how many vacation days"))
+
+    def test_different_questions_differ(self):
+        self.assertNotEqual(question_key("How many vacation days?"), question_key("How many sick days?"))
+
+
+class AnswerStoreTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = AnswerStore(os.path.join(directory.name, "answers.db"))
+        self.addCleanup(self.store._conn.close)
+
+    def ask(self, question, times, category=None):
+        for _ in range(times):
+            self.store.record_question(question, category)
+
+    def test_frequent_questions_are_ranked_by_count(self):
+        self.ask("How many vacation days?", 4)
+        self.ask("how many vacation days", 1)
+        self.ask("Who approves expenses?", 3, "Compensation & Benefits")
+        self.ask("Where is the parking lot?", 2)
+        self.assertEqual(self.store.frequent_questions(limit=10, min_count=3), [
+            ("how many vacation days", ALL_CATEGORIES),
+            ("Who approves expenses?", "Compensation & Benefits"),
+        ])
+        self.assertEqual(len(self.store.frequent_questions(limit=1, min_count=1)), 1)
+
+    def test_get_returns_the_stored_answer(self):
+        sources = [{"source": "leave.pdf", "page": 3}]
+        self.store.put("How many vacation days?", None, "Twenty.", sources, "hr_policies")
+        stored = self.store.get("how many vacation days", collection="hr_policies")
+        self.assertEqual((stored["answer"], stored["sources"]), ("Twenty.", sources))
+        self.assertIsNone(self.store.get("How many vacation days?", "Leave Policies", "hr_policies"))
+
+    def test_answers_from_another_collection_are_ignored(self):
+        self.store.put("How many vacation days?", None, "Twenty.", None, "hr_policies")
+        self.assertIsNone(self.store.get("How many vacation days?", collection="hr_policies_v2"))
+        self.assertEqual(self.store.get("How many vacation days?")["sources"], [])
+
+    def test_prune_keeps_only_the_given_questions(self):
+        self.store.put("Kept?", None, "Yes.", None, "hr_policies")
+        self.store.put("Dropped?", None, "No.", None, "hr_policies")
+        self.assertEqual(self.store.prune([("kept", ALL_CATEGORIES)]), 1)
+        self.assertIsNotNone(self.store.get("Kept?"))
+        self.assertIsNone(self.store.get("Dropped?"))
+
+    def test_questions_to_precompute(self):
+        # Asked often enough for the default PRECOMPUTE_MIN_COUNT
+        self.ask(COMMON_QUESTIONS[0].upper(), 5)
+        self.ask("How many vacation days?", 5)
+        self.ask("How many vacation days?", 5, "Leave Policies")
+        questions = questions_to_precompute(self.store)
+        self.assertEqual(questions[:len(COMMON_QUESTIONS)], [(q, ALL_CATEGORIES) for q in COMMON_QUESTIONS])
+        self.assertEqual(sorted(questions[len(COMMON_QUESTIONS):]), [
+            ("How many vacation days?", ALL_CATEGORIES),
+            ("How many vacation days?", "Leave Policies"),
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
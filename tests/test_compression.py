@@ -0,0 +1,58 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from compression import compress_contexts, split_sentences
+
+
+def fake_embed_batch(texts, model=None):
+    """Sentences mentioning "vacation" point the same way as the query"""
+    return np.array([[1.0, 0.1] if "vacation" in text.lower() else [0.0, 1.0] for text in texts])
+
+
+PAGE = (
+    "Employees receive twenty vacation days per calendar year. "
+    "Parking permits are issued by the facilities team on request. "
+    "Unused vacation days can be carried over until the end of March. "
+    "The cafeteria is open from eight in the morning until three."
+)
+
+
+class SplitSentencesTest(unittest.TestCase):
+    def test_short_fragments_are_merged(self):
+        self.assertEqual(
+            split_sentences("Leave Policy.\n\nEmployees must request leave in advance. Page 3"),
+            ["Leave Policy.", "Employees must request leave in advance. Page 3"],
+        )
+
+
+@mock.patch("compression.embed_batch", side_effect=fake_embed_batch)
+class CompressContextsTest(unittest.TestCase):
+    def context(self, text=PAGE):
+        return {"text": text, "source": "leave.pdf", "page": 3}
+
+    def test_contexts_within_budget_are_unchanged(self, embed):
+        contexts = [self.context()]
+        self.assertIs(compress_contexts("vacation", contexts, budget_chars=10_000), contexts)
+        embed.assert_not_called()
+
+    def test_relevant_sentences_are_kept_within_budget(self, embed):
+        compressed = compress_contexts("How many vacation days?", [self.context()], budget_chars=130, neighbors=0)
+        self.assertEqual(len(compressed), 1)
+        self.assertEqual(
+            compressed[0]["text"],
+            "Employees receive twenty vacation days per calendar year. … "
+            "Unused vacation days can be carried over until the end of March.",
+        )
+        self.assertEqual((compressed[0]["source"], compressed[0]["page"]), ("leave.pdf", 3))
+        self.assertEqual(compressed[0]["original_chars"], len(PAGE))
+
+    def test_best_sentence_is_kept_even_over_budget(self, embed):
+        compressed = compress_contexts("vacation", [self.context()], budget_chars=10, neighbors=0)
+        self.assertEqual(len(compressed), 1)
+        self.assertIn("vacation", compressed[0]["text"])
+
+
+if __name__ == "__main__":
+    unittest.main()
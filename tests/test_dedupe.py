@@ -0,0 +1,53 @@
+import unittest
+
+from dedupe import DedupeIndex, content_hash, minhash_signature
+
+POLICY = (
+    "Employees accrue vacation days monthly and may carry over up to five unused days "
+    "into the next calendar year with the approval of their manager and the HR team"
+)
+
+
+def fingerprint(text):
+    return content_hash(text), minhash_signature(text)
+
+
+class DedupeIndexTest(unittest.TestCase):
+    def test_exact_duplicate(self):
+        index = DedupeIndex()
+        index.add("a", *fingerprint(POLICY))
+        self.assertEqual(index.find(*fingerprint(POLICY)), ("a", 1.0))
+        self.assertEqual(index.exact_duplicates, 1)
+
+    def test_near_duplicate(self):
+        index = DedupeIndex(threshold=0.5)
+        index.add("a", *fingerprint(POLICY))
+        match = index.find(*fingerprint(POLICY + " in writing"))
+        self.assertEqual(match[0], "a")
+        self.assertGreaterEqual(match[1], 0.5)
+        self.assertEqual(index.near_duplicates, 1)
+
+    def test_unrelated_text_is_new(self):
+        index = DedupeIndex()
+        index.add("a", *fingerprint(POLICY))
+        self.assertIsNone(index.find(*fingerprint("Expense reports are due within thirty days of travel")))
+        self.assertEqual(index.dedupe_ratio, 0.0)
+
+    def test_other_categories_are_not_matched(self):
+        index = DedupeIndex(threshold=0.5)
+        index.add("a", *fingerprint(POLICY), category="Compensation & Benefits")
+        self.assertIsNone(index.find(*fingerprint(POLICY), category="Leave Policies"))
+        self.assertIsNone(index.find(*fingerprint(POLICY + " in writing"), category="Leave Policies"))
+        self.assertEqual(index.find(*fingerprint(POLICY), category="Compensation & Benefits"), ("a", 1.0))
+
+    def test_removed_chunks_are_not_found(self):
+        index = DedupeIndex(threshold=0.5)
+        index.add("a", *fingerprint(POLICY))
+        index.remove(["a"])
+        self.assertIsNone(index.find(*fingerprint(POLICY)))
+        self.assertIsNone(index.find(*fingerprint(POLICY + " in writing")))
+        self.assertEqual(len(index), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
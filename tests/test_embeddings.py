@@ -0,0 +1,42 @@
+import unittest
+
+import numpy as np
+
+from embeddings import rescore_by_full_vector, truncate_embedding
+
+
+class TruncateEmbeddingTest(unittest.TestCase):
+    def test_prefix_is_renormalized(self):
+        truncated = truncate_embedding([3.0, 4.0, 12.0], dim=2)
+        np.testing.assert_allclose(truncated, [0.6, 0.8], rtol=1e-6)
+
+    def test_no_truncation(self):
+        self.assertEqual(truncate_embedding([0.1, 0.2], dim=None), [0.1, 0.2])
+        self.assertEqual(truncate_embedding([0.1, 0.2], dim=0), [0.1, 0.2])
+        self.assertEqual(truncate_embedding([0.1, 0.2], dim=5), [0.1, 0.2])
+
+    def test_zero_prefix_is_left_as_is(self):
+        self.assertEqual(truncate_embedding([0.0, 0.0, 1.0], dim=2), [0.0, 0.0])
+
+
+class RescoreByFullVectorTest(unittest.TestCase):
+    def test_ranks_by_full_vector_cosine(self):
+        candidates = [("far", [0.0, 1.0]), ("close", [1.0, 0.1]), ("exact", [2.0, 0.0])]
+        ranked = rescore_by_full_vector([1.0, 0.0], candidates, limit=3)
+        self.assertEqual([item for item, _ in ranked], ["exact", "close", "far"])
+        self.assertAlmostEqual(ranked[0][1], 0.0, places=5)
+        self.assertAlmostEqual(ranked[2][1], 1.0, places=5)
+
+    def test_items_without_vectors_go_last(self):
+        candidates = [("legacy", None), ("far", [0.0, 1.0]), ("close", [1.0, 0.0])]
+        ranked = rescore_by_full_vector([1.0, 0.0], candidates, limit=3)
+        self.assertEqual(ranked[-1], ("legacy", None))
+        self.assertEqual([item for item, _ in rescore_by_full_vector([1.0, 0.0], candidates, limit=2)],
+                         ["close", "far"])
+
+    def test_only_legacy_items(self):
+        self.assertEqual(rescore_by_full_vector([1.0], [("a", None), ("b", [])], limit=1), [("a", None)])
+
+
+if __name__ == "__main__":
+    unittest.main()
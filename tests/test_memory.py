@@ -0,0 +1,28 @@
+import unittest
+
+from memory import AIMessage, HumanMessage, WindowMemory
+
+
+class WindowMemoryTest(unittest.TestCase):
+    def test_keeps_the_last_k_exchanges(self):
+        memory = WindowMemory(k=2)
+        for i in range(3):
+            memory.save_context({"input": f"q{i}"}, {"output": f"a{i}"})
+        history = memory.load_memory_variables({})["history"]
+        self.assertEqual([message.content for message in history], ["q1", "a1", "q2", "a2"])
+        self.assertEqual([type(message) for message in history], [HumanMessage, AIMessage] * 2)
+
+    def test_zero_window_is_empty(self):
+        memory = WindowMemory(k=0)
+        memory.save_context({"input": "q"}, {"output": "a"})
+        self.assertEqual(memory.load_memory_variables()["history"], [])
+
+    def test_clear(self):
+        memory = WindowMemory()
+        memory.save_context({"input": "q"}, {"output": "a"})
+        memory.clear()
+        self.assertEqual(memory.load_memory_variables()["history"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
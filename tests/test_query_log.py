@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from query_log import log_query, query_hash, query_log_report, read_query_log
+
+
+def context(uuid, source, distance, page=1):
+    return {"uuid": uuid, "source": source, "page": page, "distance": distance}
+
+
+class QueryLogTest(unittest.TestCase):
+    def setUp(self):
+        enabled = mock.patch("query_log.QUERY_LOG", True)
+        enabled.start()
+        self.addCleanup(enabled.stop)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "query_log.jsonl")
+
+    def test_entries_are_anonymous(self):
+        log_query("How many Vacation days?", None, "hr_policies", [context("a", "leave.pdf", 0.2)], 0.05,
+                  path=self.path)
+        entry, = read_query_log(self.path)
+        self.assertEqual(entry["query_hash"], query_hash("how many  vacation days?"))
+        self.assertEqual((entry["category"], entry["latency_ms"]), ("All Categories", 50.0))
+        with open(self.path) as f:
+            self.assertNotIn("Vacation", f.read())
+
+    def test_log_rotates_past_the_size_limit(self):
+        with mock.patch("query_log.QUERY_LOG_MAX_MB", 200 / (1024 * 1024)):
+            for _ in range(5):
+                log_query("q", None, "hr_policies", [context("a", "leave.pdf", 0.2)], 0.01, path=self.path)
+        self.assertTrue(os.path.exists(self.path + ".1"))
+        self.assertLess(len(list(read_query_log(self.path))), 5)
+
+    def test_disabled_log_writes_nothing(self):
+        with mock.patch("query_log.QUERY_LOG", False):
+            log_query("q", None, "hr_policies", [], 0.01, path=self.path)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_report(self):
+        log_query("q1", None, "hr_policies",
+                  [context("a", "leave.pdf", 0.1), context("b", "leave.pdf", 0.3, page=2)], 0.010,
+                  cached=0, fetched=2, path=self.path)
+        log_query("q2", "Leave Policies", "hr_policies", [context("a", "leave.pdf", 0.2)], 0.030,
+                  cached=1, fetched=0, path=self.path)
+        log_query("q3", None, "hr_policies", [context("c", "pay.pdf", 0.4)], 0.020,
+                  cached=0, fetched=1, path=self.path)
+        with open(self.path, "a") as f:
+            f.write('{"partially written')
+
+        report = query_log_report(self.path, limit=2)
+        self.assertEqual(report["queries"], 3)
+        self.assertEqual(report["p50_ms"], 20.0)
+        self.assertEqual(report["cache_ratio"], 0.25)
+        self.assertEqual(report["documents"][0], {"Document": "leave.pdf", "Queries": 2, "Chunk Hits": 3})
+        self.assertEqual(report["chunks"][0], {"Document": "leave.pdf", "Page": 1, "Hits": 2, "Avg Distance": 0.15})
+        self.assertEqual([row["Latency (ms)"] for row in report["slowest"]], [30.0, 20.0])
+
+    def test_report_since(self):
+        log_query("q", None, "hr_policies", [], 0.01, path=self.path)
+        entry, = read_query_log(self.path)
+        self.assertEqual(query_log_report(self.path, since=entry["ts"] + 1)["queries"], 0)
+        self.assertEqual(query_log_report(os.path.join(os.path.dirname(self.path), "missing.jsonl"))["queries"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
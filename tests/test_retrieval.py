@@ -0,0 +1,82 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from retrieval import ChunkCache, autocut, rank_results
+
+
+class AutocutTest(unittest.TestCase):
+    def cut(self, distances, **kwargs):
+        kwargs.setdefault("min_k", 1)
+        kwargs.setdefault("max_k", 8)
+        kwargs.setdefault("max_distance", None)
+        kwargs.setdefault("min_jump", 0.05)
+        return autocut(distances, **kwargs)
+
+    def test_cuts_at_the_largest_gap(self):
+        self.assertEqual(self.cut([0.20, 0.22, 0.24, 0.45, 0.47]), 3)
+
+    def test_keeps_everything_without_a_clear_gap(self):
+        self.assertEqual(self.cut([0.20, 0.22, 0.24, 0.26]), 4)
+
+    def test_keeps_at_least_min_k(self):
+        self.assertEqual(self.cut([0.10, 0.40, 0.42, 0.60], min_k=2), 3)
+
+    def test_never_keeps_more_than_max_k(self):
+        self.assertEqual(self.cut([0.20, 0.21, 0.22, 0.23, 0.24], max_k=3), 3)
+
+    def test_drops_hits_beyond_max_distance(self):
+        self.assertEqual(self.cut([0.20, 0.22, 0.60], max_distance=0.5), 2)
+        self.assertEqual(self.cut([0.70, 0.80], max_distance=0.5), 0)
+
+    def test_short_lists(self):
+        self.assertEqual(self.cut([]), 0)
+        self.assertEqual(self.cut([0.30]), 1)
+
+
+def search_hit(uuid, distance):
+    return None, SimpleNamespace(uuid=uuid, metadata=SimpleNamespace(distance=distance))
+
+
+def payload(full_vector=None):
+    return {"text": "text", "source": "leave.pdf", "page": 1, "full_vector": full_vector}
+
+
+class RankResultsTest(unittest.TestCase):
+    @mock.patch("retrieval.EMBEDDING_RESCORE", True)
+    @mock.patch("retrieval.RETRIEVAL_MAX_DISTANCE", 0.5)
+    def test_rescored_hits_are_cut_in_distance_order(self):
+        # "legacy" has no full vector, so rescoring appends it after the rescored hits
+        results = [search_hit("legacy", 0.01), search_hit("near", 0.20), search_hit("far", 0.30)]
+        payloads = {"legacy": payload(), "near": payload([1.0, 0.0]), "far": payload([0.0, 1.0])}
+        contexts = rank_results(results, payloads, [1.0, 0.0], top_k=3, adaptive=True)
+        distances = [ctx["distance"] for ctx in contexts]
+        self.assertEqual(distances, sorted(distances))
+        self.assertEqual([ctx["uuid"] for ctx in contexts], ["near", "legacy"])
+
+
+class ChunkCacheTest(unittest.TestCase):
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = ChunkCache(max_entries=2)
+        cache.put_many("c", {"a": {"text": "a"}, "b": {"text": "b"}})
+        cache.get_many("c", ["a"])
+        cache.put_many("c", {"d": {"text": "d"}})
+        self.assertEqual(set(cache.get_many("c", ["a", "b", "d"])), {"a", "d"})
+
+    def test_collections_do_not_share_entries(self):
+        cache = ChunkCache(max_entries=4)
+        cache.put_many("c", {"a": {"text": "a"}})
+        self.assertEqual(cache.get_many("other", ["a"]), {})
+
+    def test_clear(self):
+        cache = ChunkCache(max_entries=4)
+        cache.put_many("c", {"a": {"text": "a"}})
+        cache.get_many("c", ["a", "b"])
+        cache.clear()
+        self.assertEqual(cache.get_many("c", ["a"]), {})
+        self.assertEqual(cache.stats()["hits"], 0)
+        self.assertEqual(cache.stats()["entries"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import threading
+import time
+import unittest
+
+from scheduler import (
+    GenerationScheduler,
+    SchedulerBusyError,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_NORMAL,
+    priority_for,
+)
+
+
+class SchedulerTest(unittest.TestCase):
+    def make_scheduler(self, **kwargs):
+        kwargs.setdefault("max_concurrency", 1)
+        kwargs.setdefault("poll_interval", 0.01)
+        return GenerationScheduler(**kwargs)
+
+    def wait_for_queued(self, scheduler, count):
+        deadline = time.monotonic() + 2
+        while scheduler.stats()["queued"] < count:
+            if time.monotonic() > deadline:
+                self.fail(f"expected {count} queued requests")
+            time.sleep(0.005)
+
+    def queue_requests(self, scheduler, requests):
+        """Queue (user, priority) requests one after another while the only slot is held
+
+        Returns the order in which the requests were admitted.
+        """
+        order = []
+        lock = threading.Lock()
+
+        def run(user_id, priority):
+            release = scheduler.acquire(user_id, priority=priority)
+            with lock:
+                order.append(user_id)
+            release()
+
+        threads = []
+        for queued, (user_id, priority) in enumerate(requests, 1):
+            thread = threading.Thread(target=run, args=(user_id, priority))
+            thread.start()
+            threads.append(thread)
+            self.wait_for_queued(scheduler, queued)
+        return threads, order
+
+    def test_interactive_requests_are_served_first(self):
+        scheduler = self.make_scheduler()
+        release = scheduler.acquire("holder")
+        threads, order = self.queue_requests(scheduler, [
+            ("rag", PRIORITY_NORMAL),
+            ("routing", PRIORITY_INTERACTIVE),
+        ])
+        release()
+        for thread in threads:
+            thread.join(2)
+        self.assertEqual(order, ["routing", "rag"])
+
+    def test_recently_served_user_waits_behind_others(self):
+        scheduler = self.make_scheduler()
+        scheduler.acquire("busy")()
+        release = scheduler.acquire("holder")
+        threads, order = self.queue_requests(scheduler, [
+            ("busy", PRIORITY_NORMAL),
+            ("new", PRIORITY_NORMAL),
+        ])
+        release()
+        for thread in threads:
+            thread.join(2)
+        self.assertEqual(order, ["new", "busy"])
+
+    def test_full_queue_is_rejected(self):
+        scheduler = self.make_scheduler(max_queue=0)
+        with self.assertRaises(SchedulerBusyError):
+            scheduler.acquire("user")
+        self.assertEqual(scheduler.stats()["rejected"], 1)
+
+    def test_wait_times_out_and_leaves_the_queue(self):
+        scheduler = self.make_scheduler(max_wait=0.05)
+        release = scheduler.acquire("holder")
+        with self.assertRaises(SchedulerBusyError):
+            scheduler.acquire("late")
+        stats = scheduler.stats()
+        self.assertEqual((stats["queued"], stats["timed_out"]), (0, 1))
+        release()
+        self.assertEqual(scheduler.stats()["running"], 0)
+
+    def test_exception_in_on_wait_withdraws_the_request(self):
+        scheduler = self.make_scheduler()
+        release = scheduler.acquire("holder")
+
+        def give_up(position, waited):
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            scheduler.acquire("user", on_wait=give_up)
+        self.assertEqual(scheduler.stats()["queued"], 0)
+        release()
+
+    def test_release_is_idempotent(self):
+        scheduler = self.make_scheduler(max_concurrency=2)
+        release = scheduler.acquire("user")
+        release()
+        release()
+        self.assertEqual(scheduler.stats()["running"], 0)
+
+    def test_idle_users_are_forgotten(self):
+        scheduler = self.make_scheduler(max_concurrency=2, max_wait=0.02)
+        for user_id in ("a", "b", "c"):
+            scheduler.acquire(user_id)()
+        time.sleep(0.05)
+        release = scheduler.acquire("d")
+        release()
+        self.assertEqual(set(scheduler._last_served), {"d"})
+
+    def test_priority_for(self):
+        self.assertEqual(priority_for("routing", "x" * 10_000), PRIORITY_INTERACTIVE)
+        self.assertEqual(priority_for("general", "hi"), PRIORITY_INTERACTIVE)
+        self.assertEqual(priority_for("general", "x" * 10_000), PRIORITY_NORMAL)
+        self.assertEqual(priority_for("rag", "hi"), PRIORITY_NORMAL)
+
+
+if __name__ == "__main__":
+    unittest.main()
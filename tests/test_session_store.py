@@ -0,0 +1,44 @@
+import os
+import tempfile
+import unittest
+
+from session_store import SessionStore
+
+
+class SessionStoreTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = SessionStore(os.path.join(directory.name, "sessions.db"))
+        self.addCleanup(self.store._conn.close)
+        self.ids = [self.store.append("c1", "user", f"message {i}")["id"] for i in range(10)]
+        self.store.append("c2", "user", "other conversation")
+
+    def contents(self, messages):
+        return [message["content"] for message in messages]
+
+    def test_recent_returns_the_window_oldest_first(self):
+        self.assertEqual(self.contents(self.store.recent("c1", limit=3)), ["message 7", "message 8", "message 9"])
+
+    def test_pages_walk_back_without_gaps(self):
+        oldest_loaded = self.store.recent("c1", limit=3)[0]["id"]
+        self.assertEqual(self.store.count_before("c1", oldest_loaded), 7)
+        page = self.store.before("c1", oldest_loaded, limit=4)
+        self.assertEqual(self.contents(page), ["message 3", "message 4", "message 5", "message 6"])
+        page = self.store.before("c1", page[0]["id"], limit=4)
+        self.assertEqual(self.contents(page), ["message 0", "message 1", "message 2"])
+        self.assertEqual(self.store.count_before("c1", page[0]["id"]), 0)
+
+    def test_sources_round_trip(self):
+        sources = [{"source": "leave.pdf", "page": 3}]
+        message = self.store.append("c3", "assistant", "answer", sources)
+        self.assertEqual(self.store.recent("c3"), [message])
+
+    def test_clear_only_affects_one_conversation(self):
+        self.store.clear("c1")
+        self.assertEqual(self.store.recent("c1"), [])
+        self.assertEqual(self.contents(self.store.recent("c2")), ["other conversation"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import asyncio
+import threading
+import time
+import unittest
+
+import speculation
+from speculation import SpeculativeRetrieval
+
+
+def retrieve(collection, query, category=None, log=None):
+    log(query, category, "hr_policies", [], 0.01)
+    return [query]
+
+
+async def slow_retrieve(collection, query, category=None, log=None):
+    await asyncio.sleep(5)
+
+
+class SpeculativeRetrievalTest(unittest.TestCase):
+    def setUp(self):
+        self.logged = []
+        original = speculation.log_query
+        speculation.log_query = lambda *args, **kwargs: self.logged.append(args)
+        self.addCleanup(setattr, speculation, "log_query", original)
+        self.before = speculation.speculation_stats()
+
+    def delta(self, key):
+        return speculation.speculation_stats()[key] - self.before[key]
+
+    def test_claimed_result_is_logged_once(self):
+        spec = SpeculativeRetrieval(retrieve, None, "q", category="Leave Policies")
+        self.assertEqual(spec.result(timeout=2), ["q"])
+        spec.discard()
+        self.assertEqual(self.logged, [("q", "Leave Policies", "hr_policies", [], 0.01)])
+        self.assertEqual(self.delta("used"), 1)
+
+    def test_discarded_result_is_wasted_and_not_logged(self):
+        spec = SpeculativeRetrieval(retrieve, None, "q")
+        spec._future.result(timeout=2)
+        spec.discard()
+        spec.discard()
+        self.assertEqual(self.logged, [])
+        self.assertEqual(self.delta("wasted"), 1)
+
+    def test_cancelled_pipeline_retrieval_counts_as_wasted(self):
+        loop = asyncio.new_event_loop()
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        self.addCleanup(loop.call_soon_threadsafe, loop.stop)
+        # Let the cancelled task finish unwinding before the loop stops
+        self.addCleanup(lambda: asyncio.run_coroutine_threadsafe(asyncio.sleep(0.01), loop).result(2))
+
+        spec = SpeculativeRetrieval(
+            slow_retrieve, None, "q", submit=lambda coro: asyncio.run_coroutine_threadsafe(coro, loop)
+        )
+        time.sleep(0.02)
+        spec.discard()
+        self.assertTrue(spec._future.cancelled())
+        self.assertEqual((self.delta("wasted"), self.delta("cancelled")), (1, 0))
+        self.assertGreater(self.delta("wasted_seconds"), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
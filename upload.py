@@ -1,12 +1,35 @@
 import streamlit as st
-import weaviate
-import weaviate.exceptions
-import ollama
 import pypdf
 import os
-import tempfile
+import time
+import itertools
 import weaviate.classes as wvc
-from weaviate.classes.config import Property, DataType
+from vectorstore import (
+    connect_weaviate,
+    initialize_collection,
+    get_active_index,
+    is_draining,
+    is_partitioned,
+    partition,
+    partitions,
+    all_partitions,
+    set_partition_active,
+    tenant_name,
+    POLICY_CATEGORIES,
+)
+from embeddings import embed_for_index, EMBEDDING_RESCORE
+from dedupe import content_hash, minhash_signature, signature_to_str, load_index_from_collection
+from answers import AnswerRefresher, AnswerStore, PRECOMPUTED_ANSWERS
+from query_log import query_log_report
+
+# How duplicate chunks are handled at ingestion: "link" stores them without a vector
+# pointing at the canonical chunk, "skip" drops them, "off" embeds everything
+DEDUPE_MODE = os.environ.get("DEDUPE_MODE", "link")
+DEDUPE_THRESHOLD = float(os.environ.get("DEDUPE_THRESHOLD", "0.85"))
+
+# Per-file upload limits; larger files are rejected before they are parsed
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", "50"))
+MAX_PDF_PAGES = int(os.environ.get("MAX_PDF_PAGES", "3000"))
 
 # Set page configuration
 st.set_page_config(page_title="HR Policy Document Manager", layout="wide", page_icon="📁")
@@ -14,99 +37,237 @@ st.set_page_config(page_title="HR Policy Document Manager", layout="wide", page_
 # Connect to Weaviate instance
 @st.cache_resource
 def get_weaviate_client():
-    weaviate_host = os.environ.get("WEAVIATE_HOST", "localhost")
-    weaviate_grpc_host = os.environ.get("WEAVIATE_GRPC_HOST", weaviate_host)
-    return weaviate.connect_to_custom(
-        http_host=weaviate_host,
-        http_port=8080,
-        http_secure=False,  # Set to True if using HTTPS
-        grpc_host=weaviate_grpc_host,
-        grpc_port=50051,
-        grpc_secure=False,  # Set to True if using secure gRPC
-        additional_config=weaviate.AdditionalConfig(
-            trust_env=True  # Required for custom SSL certificates
-        )
-    )
-# Create a data collection if it doesn't exist
-def initialize_collection(client):
-    collection_name = "hr_policies"
-    try:
-        # Try to get the collection first
-        collection = client.collections.get(collection_name)
-    except weaviate.exceptions.WeaviateCollectionDoesNotExistException:
-        # If collection doesn't exist, create it
-        collection = client.collections.create(
-            name=collection_name,
-            properties=[
-                Property(name="text", data_type=DataType.TEXT),
-                Property(name="source", data_type=DataType.TEXT),
-                Property(name="page", data_type=DataType.INT),
-                Property(name="policy_category", data_type=DataType.TEXT),
-                Property(name="last_updated", data_type=DataType.DATE),
-            ],
-        )
-    return collection
+    return connect_weaviate()
+
+# Background job regenerating the assistant's precomputed answers after corpus changes
+@st.cache_resource
+def get_answer_refresher():
+    return AnswerRefresher(get_weaviate_client(), AnswerStore())
+
+# Hotspot report from the assistant's query log, recomputed at most once a minute
+@st.cache_data(ttl=60, show_spinner=False)
+def load_query_log_report(days):
+    return query_log_report(since=time.time() - days * 86400)
 
-# Extract text from PDF
-def extract_text_from_pdf(pdf_file, file_name, policy_category, last_updated):
+# Refresh precomputed answers in the background after an ingest or delete
+def refresh_precomputed_answers():
+    if PRECOMPUTED_ANSWERS:
+        get_answer_refresher().request()
+        st.info("Precomputed answers for common questions are being refreshed in the background.")
+
+# Read a PDF page by page, yielding one chunk per non-empty page
+def extract_text_from_pdf(pdf_file, file_name, policy_category, last_updated, max_pages=None):
+    """Lazily extract page chunks from a PDF
+
+    The PDF is parsed straight from ``pdf_file`` (e.g. Streamlit's in-memory
+    upload buffer) without copying it, and pages are extracted one at a time as
+    the caller consumes them, so only one page's text is held at once.
+
+    Raises:
+        ValueError: If the document has more than ``max_pages`` pages (default
+            MAX_PDF_PAGES); raised before any chunk is yielded
+    """
+    max_pages = MAX_PDF_PAGES if max_pages is None else max_pages
+    pdf_file.seek(0)
     pdf_reader = pypdf.PdfReader(pdf_file)
-    text_chunks = []
+    page_count = len(pdf_reader.pages)
+    if max_pages and page_count > max_pages:
+        raise ValueError(f"{file_name} has {page_count} pages; the limit is {max_pages}")
     
-    for page_num in range(len(pdf_reader.pages)):
-        page = pdf_reader.pages[page_num]
+    for page_num, page in enumerate(pdf_reader.pages):
         text = page.extract_text()
         if text.strip():  # Only add non-empty pages
-            text_chunks.append({
+            yield {
                 "text": text,
                 "source": file_name,
                 "page": page_num + 1,
                 "policy_category": policy_category,
                 "last_updated": last_updated
-            })
-    
-    return text_chunks
+            }
+
+# Size of an uploaded file in bytes without reading it
+def upload_size(pdf_file):
+    size = getattr(pdf_file, "size", None)
+    if size is None:
+        size = pdf_file.seek(0, os.SEEK_END)
+        pdf_file.seek(0)
+    return size
+
 # Function to embed text and store in Weaviate
-def embed_and_store(collection, text_chunks):
+def embed_and_store(collection, text_chunks, dedupe_index=None, model=None, dim=None):
+    """Embed chunks and store them, skipping or linking duplicates
+
+    Args:
+        collection: Weaviate collection
+        text_chunks: Iterable of chunks, e.g. the generator returned by
+            extract_text_from_pdf; consumed one chunk at a time
+        dedupe_index: Optional DedupeIndex of the corpus; duplicates of indexed
+            chunks are not embedded again (see DEDUPE_MODE)
+        model, dim: Embedding model and truncation of the active index
+
+    Returns:
+        int: Number of chunks processed
+    """
     # Store UUIDs of inserted objects mapped to their source document
     inserted_uuids = []
     
-    with collection.batch.fixed_size(batch_size=100) as batch:
-        for chunk in text_chunks:
-            response = ollama.embeddings(model="nomic-embed-text", prompt=chunk["text"])
-            uuid = batch.add_object(
-                properties={
+    # Peek at the first chunk for the document's category and name
+    text_chunks = iter(text_chunks)
+    first_chunk = next(text_chunks, None)
+    if first_chunk is None:
+        return 0
+    chunk_count = 0
+    
+    # In the partitioned layout a document goes into its category's partition
+    collection = partition(collection, first_chunk.get("policy_category", "General"), create=True)
+    
+    try:
+        with collection.batch.fixed_size(batch_size=100) as batch:
+            for chunk in itertools.chain([first_chunk], text_chunks):
+                chunk_count += 1
+                properties = {
                     "text": chunk["text"],
                     "source": chunk["source"],
                     "page": chunk["page"],
                     "policy_category": chunk.get("policy_category", "General"),
                     "last_updated": chunk.get("last_updated", "")
-                },
-                vector=response["embedding"],
-            )
-            inserted_uuids.append(uuid)
+                }
+            
+                if dedupe_index is not None:
+                    chunk_hash = content_hash(chunk["text"])
+                    signature = minhash_signature(chunk["text"])
+                    properties["content_hash"] = chunk_hash
+                    properties["minhash"] = signature_to_str(signature)
+                
+                    duplicate = dedupe_index.find(chunk_hash, signature, properties["policy_category"])
+                    if duplicate is not None:
+                        if DEDUPE_MODE == "link":
+                            # Keep provenance but leave it out of the vector index
+                            properties["duplicate_of"] = duplicate[0]
+                            inserted_uuids.append(batch.add_object(properties=properties))
+                        continue
+            
+                vector, full_vector = embed_for_index(chunk["text"], model=model, dim=dim)
+                if EMBEDDING_RESCORE:
+                    properties["full_vector"] = full_vector
+                uuid = batch.add_object(
+                    properties=properties,
+                    vector=vector,
+                )
+                inserted_uuids.append(uuid)
+            
+                if dedupe_index is not None:
+                    dedupe_index.add(str(uuid), chunk_hash, signature, properties["policy_category"])
+    except Exception:
+        # The batch is flushed on exit, so remove what was stored of the failed document
+        if inserted_uuids:
+            collection.data.delete_many(where=wvc.query.Filter.by_id().contains_any(inserted_uuids))
+            if dedupe_index is not None:
+                dedupe_index.remove(str(uuid) for uuid in inserted_uuids)
+        raise
     
     # Store the mapping in session state for use in removal
     if "document_uuid_map" not in st.session_state:
         st.session_state.document_uuid_map = {}
     
     # Map the document name to its UUIDs
-    source_name = text_chunks[0]["source"] if text_chunks else None
-    if source_name:
-        st.session_state.document_uuid_map[source_name] = inserted_uuids
+    st.session_state.document_uuid_map[first_chunk["source"]] = inserted_uuids
+    
+    return chunk_count
+
+# Chunk UUIDs of a document in the given partition handles
+def document_chunk_ids(handles, document_name):
+    ids = set()
+    for handle in handles:
+        result = handle.query.fetch_objects(
+            filters=wvc.query.Filter.by_property("source").equal(document_name),
+            limit=10000,
+            return_properties=[],
+        )
+        ids.update(str(obj.uuid) for obj in result.objects)
+    return ids
+
+# Re-embed duplicate links whose canonical chunk was removed, so they become searchable again
+def promote_duplicate_links(collection, handles, removed_ids, model=None, dim=None):
+    """Promote the surviving duplicates of removed canonical chunks
+
+    A duplicate stored in "link" mode has no vector and is only reachable through
+    its canonical chunk. For each removed canonical chunk, the first remaining
+    link is embedded and becomes the new canonical chunk; any other links are
+    pointed at it.
+
+    Args:
+        handles: Partition handles to search for links (see all_partitions)
+
+    Returns:
+        int: Number of links promoted
+    """
+    if not removed_ids:
+        return 0
+    # Collections created before fingerprinting have no duplicate links
+    if "duplicate_of" not in {prop.name for prop in collection.config.get().properties}:
+        return 0
     
-    return len(text_chunks)
+    removed = {str(uuid) for uuid in removed_ids}
+    removed_ids = sorted(removed)
+    orphans = {}
+    for handle in handles:
+        for start in range(0, len(removed_ids), 100):
+            result = handle.query.fetch_objects(
+                filters=wvc.query.Filter.by_property("duplicate_of").contains_any(removed_ids[start:start + 100]),
+                limit=10000,
+                return_properties=["text", "duplicate_of"],
+            )
+            for obj in result.objects:
+                # Older collections tokenize duplicate_of into words, which can match UUID fragments
+                if obj.properties["duplicate_of"] in removed:
+                    orphans.setdefault(obj.properties["duplicate_of"], []).append((handle, obj))
+    
+    for links in orphans.values():
+        handle, promoted = links[0]
+        vector, full_vector = embed_for_index(promoted.properties["text"], model=model, dim=dim)
+        properties = {"duplicate_of": ""}
+        if EMBEDDING_RESCORE:
+            properties["full_vector"] = full_vector
+        handle.data.update(uuid=promoted.uuid, properties=properties, vector=vector)
+        for handle, obj in links[1:]:
+            handle.data.update(uuid=obj.uuid, properties={"duplicate_of": str(promoted.uuid)})
+    return len(orphans)
 
 # Function to remove documents from database by source name
-def remove_document(collection, document_name):
+def remove_document(collection, document_name, model=None, dim=None):
     """Remove all chunks related to a specific document from the database
     
+    Duplicate links elsewhere in the corpus that pointed at the document's
+    chunks are promoted (see promote_duplicate_links).
+    
     Args:
         collection: Weaviate collection
         document_name: Name of the document to remove
+        model, dim: Embedding model and truncation of the active index, used to
+            embed promoted links
         
     Returns:
-        int: Number of objects deleted
+        tuple: (objects deleted, duplicate links promoted)
     """
+    # Offloaded partitions are reactivated only while the document is removed
+    with all_partitions(collection) as handles:
+        removed_ids = document_chunk_ids(handles, document_name)
+        deleted_count = _delete_document_chunks(collection, handles, document_name)
+        promoted_count = promote_duplicate_links(collection, handles, removed_ids, model=model, dim=dim)
+    return deleted_count, promoted_count
+
+def _delete_document_chunks(collection, handles, document_name):
+    """Delete a document's chunks, returning the number of objects deleted"""
+    # Partitioned layout: delete the document's chunks from every partition
+    if is_partitioned(collection):
+        deleted_count = 0
+        for handle in handles:
+            result = handle.data.delete_many(where=wvc.query.Filter.by_property("source").equal(document_name))
+            deleted_count += result.successful
+        st.session_state.get("document_uuid_map", {}).pop(document_name, None)
+        return deleted_count
+    
     # Check if we have stored UUIDs for this document
     if "document_uuid_map" in st.session_state and document_name in st.session_state.document_uuid_map:
         uuids = st.session_state.document_uuid_map[document_name]
@@ -209,27 +370,11 @@ def remove_document(collection, document_name):
     
     return before_count
 
-# Define policy categories
-POLICY_CATEGORIES = [
-    "All Categories",
-    "Recruitment",
-    "Onboarding",
-    "Compensation & Benefits",
-    "Performance Management",
-    "Learning & Development",
-    "Employee Relations",
-    "Health & Safety",
-    "Termination",
-    "Code of Conduct",
-    "Diversity & Inclusion",
-    "Remote Work",
-    "Leave Policies",
-    "Other"
-]
-
 def main():
     client = get_weaviate_client()
-    collection = initialize_collection(client)
+    # Ingest into whichever collection the active-index pointer names
+    active_index = get_active_index(client)
+    collection = initialize_collection(client, active_index.collection)
     
     # Styled header
     st.markdown("<h1 style='text-align: center; margin-bottom: 0px;'>HR Policy Document Manager</h1>", unsafe_allow_html=True)
@@ -270,27 +415,54 @@ def main():
                     status_text = st.empty()
                     
                     total_chunks = 0
+                    
+                    # Fingerprints of the whole corpus so repeated boilerplate isn't embedded twice
+                    dedupe_index = None
+                    if DEDUPE_MODE != "off":
+                        status_text.write("Loading duplicate-detection index...")
+                        dedupe_index = load_index_from_collection(collection, threshold=DEDUPE_THRESHOLD)
+                    
+                    processed_files = 0
                     for i, pdf_file in enumerate(uploaded_files):
                         file_name = pdf_file.name  # Store the name separately
                         status_text.write(f"Processing: {file_name}")
-                        # Save the uploaded file temporarily to process with PyPDF2
-                        with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
-                            tmp_file.write(pdf_file.getvalue())
-                            tmp_path = tmp_file.name
                         
-                        with open(tmp_path, 'rb') as f:
-                            text_chunks = extract_text_from_pdf(f, file_name, policy_category, last_updated.strftime("%Y-%m-%d"))
-                            chunks_count = embed_and_store(collection, text_chunks)
-                            total_chunks += chunks_count
+                        # A migration is switching away from this collection; chunks written now could be lost
+                        if is_draining(client, collection.name):
+                            st.error(f"Skipped {file_name}: the index is being switched to a new collection. "
+                                     "Please upload it again in a minute.")
+                            continue
+                        
+                        # Enforce the size limit before parsing anything
+                        size = upload_size(pdf_file)
+                        if MAX_UPLOAD_MB and size > MAX_UPLOAD_MB * 1024 * 1024:
+                            st.error(f"Skipped {file_name}: {size / (1024 * 1024):.1f} MB exceeds the {MAX_UPLOAD_MB} MB limit.")
+                            continue
                         
-                        # Remove the temporary file
-                        os.unlink(tmp_path)
+                        # Parse straight from the upload buffer and embed page by page
+                        try:
+                            text_chunks = extract_text_from_pdf(pdf_file, file_name, policy_category, last_updated.strftime("%Y-%m-%d"))
+                            chunks_count = embed_and_store(collection, text_chunks, dedupe_index, **active_index.embedding_kwargs())
+                            total_chunks += chunks_count
+                            processed_files += 1
+                        except Exception as e:
+                            st.error(f"Skipped {file_name}: {e}")
+                        finally:
+                            pdf_file.seek(0)
                         
                         # Update progress bar
                         progress_bar.progress((i + 1) / len(uploaded_files))
                     
                     progress_bar.progress(1.0)
-                    st.success(f"Successfully processed {len(uploaded_files)} policy documents with {total_chunks} text chunks.")
+                    st.success(f"Successfully processed {processed_files} policy documents with {total_chunks} text chunks.")
+                    refresh_precomputed_answers()
+                    if dedupe_index is not None and dedupe_index.checked:
+                        duplicates = dedupe_index.exact_duplicates + dedupe_index.near_duplicates
+                        st.info(
+                            f"Duplicate detection: {duplicates} of {dedupe_index.checked} chunks "
+                            f"({dedupe_index.dedupe_ratio:.0%}) were duplicates and were not re-embedded "
+                            f"({dedupe_index.exact_duplicates} exact, {dedupe_index.near_duplicates} near)."
+                        )
     
     # Dashboard tab - Policy Insights
     with tab2:
@@ -300,11 +472,14 @@ def main():
             try:
                 # Retrieve all policy documents with error handling
                 try:
-                    results = collection.query.fetch_objects(
-                        limit=1000, 
-                        return_properties=["source", "policy_category", "last_updated"]
-                    )
-                    documents = results.objects
+                    # Gather from every active partition (just the collection in the single layout)
+                    documents = []
+                    for handle in partitions(collection, refresh=True):
+                        results = handle.query.fetch_objects(
+                            limit=1000, 
+                            return_properties=["source", "policy_category", "last_updated"]
+                        )
+                        documents.extend(results.objects)
                 except AttributeError:
                     # Fall back to a different query approach if the API has changed
                     st.warning("Using alternative query method due to API differences")
@@ -374,6 +549,50 @@ def main():
                                 st.info(f"UUID mapping stored for {len(st.session_state.document_uuid_map)} documents")
                                 for doc_name, uuids in st.session_state.document_uuid_map.items():
                                     st.write(f"**{doc_name}**: {len(uuids)} chunks")
+                    # Partition management for the partitioned layout
+                    if is_partitioned(collection):
+                        with st.expander("🗂️ Category Partitions"):
+                            st.caption("Offloaded categories free memory and are skipped by \"All Categories\" searches until reactivated.")
+                            active_tenants = {handle.tenant for handle in partitions(collection, refresh=True)}
+                            for category in POLICY_CATEGORIES[1:]:
+                                is_active = tenant_name(category) in active_tenants
+                                toggled = st.toggle(category, value=is_active, key=f"partition_{tenant_name(category)}")
+                                if toggled != is_active:
+                                    set_partition_active(collection, category, toggled)
+                                    st.rerun()
+                    
+                    # Status of the precomputed answers served by the assistant
+                    if PRECOMPUTED_ANSWERS:
+                        with st.expander("⚡ Precomputed Answers"):
+                            refresher = get_answer_refresher()
+                            if refresher.running:
+                                st.info("Refreshing precomputed answers...")
+                            elif refresher.last_refreshed:
+                                refreshed_at = time.strftime("%Y-%m-%d %H:%M", time.localtime(refresher.last_refreshed))
+                                st.write(f"Last refresh: {refreshed_at} ({refresher.last_count} answers)")
+                            if refresher.last_error:
+                                st.error(f"Last refresh failed: {refresher.last_error}")
+                            if st.button("🔄 Refresh Now", key="refresh_answers", disabled=refresher.running):
+                                refresher.request()
+                                st.rerun()
+                    
+                    # Which documents the assistant actually retrieves, and its slowest searches
+                    with st.expander("🔥 Retrieval Hotspots"):
+                        days = st.selectbox("Period", options=[1, 7, 30, 365], index=1, key="hotspot_days",
+                                            format_func=lambda d: f"Last {d} days" if d > 1 else "Last 24 hours")
+                        report = load_query_log_report(days)
+                        if report["queries"]:
+                            st.caption(f"{report['queries']} searches, p50 {report['p50_ms']:.0f} ms, "
+                                       f"p95 {report['p95_ms']:.0f} ms, {report['cache_ratio']:.0%} of chunks served from cache")
+                            st.write("**Most retrieved documents**")
+                            st.dataframe(report["documents"], use_container_width=True)
+                            st.write("**Most retrieved chunks**")
+                            st.dataframe(report["chunks"], use_container_width=True)
+                            st.write("**Slowest searches**")
+                            st.dataframe(report["slowest"], use_container_width=True)
+                        else:
+                            st.info("No searches logged in this period.")
+                    
                       # Search functionality for policies
                     st.subheader("Search Policies")
                     search_col1, search_col2 = st.columns([3, 1])
@@ -418,11 +637,19 @@ def main():
                         with col2:
                             remove_button = st.button("🗑️ Remove Document", key="remove_button", type="primary", use_container_width=True)
                         
-                        if remove_button and document_to_remove:
+                        if remove_button and document_to_remove and is_draining(client, collection.name):
+                            st.error("The index is being switched to a new collection. Please try again in a minute.")
+                        elif remove_button and document_to_remove:
                             try:
                                 with st.spinner(f"Removing document: {document_to_remove}"):
-                                    deleted_count = remove_document(collection, document_to_remove)
+                                    deleted_count, promoted_count = remove_document(
+                                        collection, document_to_remove, **active_index.embedding_kwargs()
+                                    )
                                     st.success(f"Successfully removed document '{document_to_remove}' ({deleted_count} chunks deleted)")
+                                    if promoted_count:
+                                        st.info(f"{promoted_count} duplicate chunk(s) in other documents were re-embedded "
+                                                "because the chunk they linked to was removed.")
+                                    refresh_precomputed_answers()
                                     st.info("Refresh the page to update the document lists.")
                                     
                                     # Add a refresh button for convenience
@@ -0,0 +1,315 @@
+import contextlib
+import json
+import os
+import re
+import threading
+import time
+from typing import NamedTuple, Optional
+
+import weaviate
+import weaviate.exceptions
+from weaviate.classes.config import Configure, Property, DataType, Tokenization
+from weaviate.classes.tenants import Tenant, TenantActivityStatus
+from weaviate.util import generate_uuid5
+
+from embeddings import EMBEDDING_MODEL, EMBEDDING_DIM
+
+# Name of the collection holding the policy chunks (until a migration switches it)
+COLLECTION_NAME = "hr_policies"
+
+# "single": one HNSW graph filtered by category; "partitioned": one tenant per
+# policy category, so category-filtered searches only touch that partition
+COLLECTION_LAYOUT = os.environ.get("COLLECTION_LAYOUT", "single")
+
+# Define policy categories
+POLICY_CATEGORIES = [
+    "All Categories",
+    "Recruitment",
+    "Onboarding",
+    "Compensation & Benefits",
+    "Performance Management",
+    "Learning & Development",
+    "Employee Relations",
+    "Health & Safety",
+    "Termination",
+    "Code of Conduct",
+    "Diversity & Inclusion",
+    "Remote Work",
+    "Leave Policies",
+    "Other"
+]
+
+# Small key/value collection holding the active-index pointer and migration state
+CONFIG_COLLECTION = "rag_config"
+ACTIVE_INDEX_KEY = "active_index"
+# How long readers trust their cached copy of the pointer
+POINTER_TTL_SECONDS = float(os.environ.get("POINTER_TTL_SECONDS", "30"))
+# Collection whose writers must stop while migrate.py switches away from it
+DRAINING_KEY = "draining"
+
+
+def collection_properties():
+    """Schema of the policy chunk collection"""
+    return [
+        Property(name="text", data_type=DataType.TEXT),
+        Property(name="source", data_type=DataType.TEXT),
+        Property(name="page", data_type=DataType.INT),
+        Property(name="policy_category", data_type=DataType.TEXT),
+        Property(name="last_updated", data_type=DataType.DATE),
+        # Fingerprints for duplicate detection at ingestion time
+        # Whole-value tokenization so filters match complete hashes and UUIDs
+        Property(name="content_hash", data_type=DataType.TEXT, index_searchable=False, tokenization=Tokenization.FIELD),
+        Property(name="minhash", data_type=DataType.TEXT, index_filterable=False, index_searchable=False),
+        Property(name="duplicate_of", data_type=DataType.TEXT, index_searchable=False, tokenization=Tokenization.FIELD),
+        # Untruncated embedding for two-stage rescoring (see embeddings.py)
+        Property(name="full_vector", data_type=DataType.NUMBER_ARRAY, index_filterable=False),
+    ]
+
+
+def _connection_params():
+    weaviate_host = os.environ.get("WEAVIATE_HOST", "localhost")
+    weaviate_grpc_host = os.environ.get("WEAVIATE_GRPC_HOST", weaviate_host)
+    return dict(
+        http_host=weaviate_host,
+        http_port=8080,
+        http_secure=False,  # Set to True if using HTTPS
+        grpc_host=weaviate_grpc_host,
+        grpc_port=50051,
+        grpc_secure=False,  # Set to True if using secure gRPC
+        additional_config=weaviate.AdditionalConfig(
+            trust_env=True  # Required for custom SSL certificates
+        )
+    )
+
+
+# Connect to Weaviate instance
+def connect_weaviate():
+    return weaviate.connect_to_custom(**_connection_params())
+
+
+# Async client for the asyncio pipeline; call ``await client.connect()`` on the loop that uses it
+def connect_weaviate_async():
+    return weaviate.use_async_with_custom(**_connection_params())
+
+
+# Create a data collection if it doesn't exist
+def initialize_collection(client, collection_name=None, layout=None):
+    """Return the named collection (default: the active index), creating it if needed
+
+    New collections use ``layout`` (default COLLECTION_LAYOUT); an existing
+    collection keeps the layout it was created with.
+    """
+    collection_name = collection_name or get_active_index(client).collection
+    layout = layout or COLLECTION_LAYOUT
+    try:
+        # Try to get the collection first
+        collection = client.collections.get(collection_name)
+    except weaviate.exceptions.WeaviateCollectionDoesNotExistException:
+        # If collection doesn't exist, create it
+        collection = client.collections.create(
+            name=collection_name,
+            properties=collection_properties(),
+            multi_tenancy_config=Configure.multi_tenancy(enabled=layout == "partitioned"),
+        )
+        if layout == "partitioned":
+            collection.tenants.create([Tenant(name=tenant_name(category)) for category in POLICY_CATEGORIES[1:]])
+    return collection
+
+
+def tenant_name(category):
+    """Tenant used for a policy category (tenant names only allow [A-Za-z0-9_-])"""
+    return re.sub(r"[^A-Za-z0-9]+", "_", category).strip("_") or "General"
+
+
+_layout_cache = {}
+_tenant_cache = {}
+
+# Current clients report ACTIVE/INACTIVE; older ones only know HOT/COLD
+_ACTIVE = getattr(TenantActivityStatus, "ACTIVE", None) or TenantActivityStatus.HOT
+_INACTIVE = getattr(TenantActivityStatus, "INACTIVE", None) or TenantActivityStatus.COLD
+_ACTIVE_STATUSES = {status for status in (_ACTIVE, getattr(TenantActivityStatus, "HOT", None)) if status is not None}
+
+
+def is_partitioned(collection):
+    """Whether the collection stores each category in its own tenant"""
+    if collection.name not in _layout_cache:
+        _layout_cache[collection.name] = collection.config.get().multi_tenancy_config.enabled
+    return _layout_cache[collection.name]
+
+
+def _tenants(collection, refresh=False):
+    """Tenant name -> activity status, cached for POINTER_TTL_SECONDS"""
+    cached = _tenant_cache.get(collection.name)
+    if refresh or cached is None or time.monotonic() > cached[1]:
+        statuses = {name: tenant.activity_status for name, tenant in collection.tenants.get().items()}
+        cached = (statuses, time.monotonic() + POINTER_TTL_SECONDS)
+        _tenant_cache[collection.name] = cached
+    return cached[0]
+
+
+def partition(collection, category, create=False):
+    """Collection handle scoped to one category's partition
+
+    For the single layout this is the collection itself. Inactive (offloaded)
+    partitions are reactivated on access; missing ones are created when
+    ``create`` is set, e.g. when ingesting a new category.
+    """
+    if not is_partitioned(collection):
+        return collection
+    name = tenant_name(category or "Other")
+    status = _tenants(collection).get(name)
+    if status is None:
+        status = _tenants(collection, refresh=True).get(name)
+    if status is None:
+        if not create:
+            return None
+        collection.tenants.create([Tenant(name=name)])
+        _tenants(collection, refresh=True)
+    elif status not in _ACTIVE_STATUSES:
+        set_partition_active(collection, category, True)
+    return collection.with_tenant(name)
+
+
+def partitions(collection, refresh=False):
+    """Handles for every active partition of the collection
+
+    Uses the tenant list cached for POINTER_TTL_SECONDS, so searches don't pay
+    for a tenants round trip; admin views pass ``refresh`` for the current state.
+    """
+    if not is_partitioned(collection):
+        return [collection]
+    return [
+        collection.with_tenant(name)
+        for name, status in _tenants(collection, refresh=refresh).items()
+        if status in _ACTIVE_STATUSES
+    ]
+
+
+@contextlib.contextmanager
+def all_partitions(collection):
+    """Handles for every partition, including offloaded ones
+
+    Offloaded partitions are activated for the duration of the block (e.g. to
+    delete or export their objects) and put back into their previous state
+    afterwards, so admin actions don't undo offloading.
+    """
+    if not is_partitioned(collection):
+        yield [collection]
+        return
+    statuses = _tenants(collection, refresh=True)
+    inactive = {name: status for name, status in statuses.items() if status not in _ACTIVE_STATUSES}
+    if inactive:
+        collection.tenants.update([Tenant(name=name, activity_status=_ACTIVE) for name in inactive])
+    try:
+        yield [collection.with_tenant(name) for name in statuses]
+    finally:
+        if inactive:
+            collection.tenants.update([Tenant(name=name, activity_status=status) for name, status in inactive.items()])
+        _tenants(collection, refresh=True)
+
+
+def set_partition_active(collection, category, active):
+    """Mark a category partition active (searchable) or inactive (offloaded from memory)"""
+    status = _ACTIVE if active else _INACTIVE
+    collection.tenants.update([Tenant(name=tenant_name(category), activity_status=status)])
+    _tenants(collection, refresh=True)
+
+
+class ActiveIndex(NamedTuple):
+    """Which collection readers and writers use, and how it was embedded"""
+    collection: str
+    embedding_model: str
+    embedding_dim: Optional[int]  # 0 or None = full-size vectors
+
+    def embedding_kwargs(self):
+        """Keyword arguments for embed_for_index / query_documents"""
+        return {"model": self.embedding_model, "dim": self.embedding_dim or 0}
+
+
+def _config_collection(client):
+    if not client.collections.exists(CONFIG_COLLECTION):
+        return client.collections.create(
+            name=CONFIG_COLLECTION,
+            properties=[
+                Property(name="key", data_type=DataType.TEXT),
+                Property(name="value", data_type=DataType.TEXT, index_filterable=False, index_searchable=False),
+            ],
+        )
+    return client.collections.get(CONFIG_COLLECTION)
+
+
+def get_config_value(client, key, default=None):
+    """Read a JSON value from the config collection"""
+    if not client.collections.exists(CONFIG_COLLECTION):
+        return default
+    obj = client.collections.get(CONFIG_COLLECTION).query.fetch_object_by_id(generate_uuid5(key))
+    if obj is None:
+        return default
+    return json.loads(obj.properties["value"])
+
+
+def set_config_value(client, key, value):
+    """Write a JSON value to the config collection (a single-object, atomic replace)"""
+    collection = _config_collection(client)
+    uuid = generate_uuid5(key)
+    properties = {"key": key, "value": json.dumps(value)}
+    if collection.data.exists(uuid):
+        collection.data.replace(uuid=uuid, properties=properties)
+    else:
+        collection.data.insert(uuid=uuid, properties=properties)
+
+
+def migration_key(target):
+    """Config key of migrate.py's state for a shadow collection"""
+    return f"migration:{target}"
+
+
+def is_draining(client, collection_name):
+    """Whether writes to the collection are paused for an index switch
+
+    Read uncached, so writers notice a switch as soon as it starts.
+    """
+    value = get_config_value(client, DRAINING_KEY)
+    return bool(value) and value.get("collection") == collection_name
+
+
+def default_index():
+    """Active index used before any migration has written a pointer"""
+    return ActiveIndex(COLLECTION_NAME, EMBEDDING_MODEL, EMBEDDING_DIM or 0)
+
+
+_pointer_cache = {"value": None, "expires": 0.0}
+_pointer_lock = threading.Lock()
+
+
+def get_active_index(client, refresh=False):
+    """Resolve the active-index pointer, cached for POINTER_TTL_SECONDS"""
+    with _pointer_lock:
+        if refresh or _pointer_cache["value"] is None or time.monotonic() > _pointer_cache["expires"]:
+            value = get_config_value(client, ACTIVE_INDEX_KEY)
+            _pointer_cache["value"] = ActiveIndex(**value) if value else default_index()
+            _pointer_cache["expires"] = time.monotonic() + POINTER_TTL_SECONDS
+        return _pointer_cache["value"]
+
+
+def set_active_index(client, active_index):
+    """Atomically point all readers and writers at another collection"""
+    set_config_value(client, ACTIVE_INDEX_KEY, active_index._asdict())
+    with _pointer_lock:
+        _pointer_cache["value"] = active_index
+        _pointer_cache["expires"] = time.monotonic() + POINTER_TTL_SECONDS
+
+
+def index_for_collection(client, collection_name):
+    """How a collection was embedded, or None if that isn't recorded
+
+    The active collection is described by the pointer, shadow collections by
+    the state migrate.py keeps for them.
+    """
+    active = get_active_index(client, refresh=True)
+    if active.collection == collection_name:
+        return active
+    state = get_config_value(client, migration_key(collection_name))
+    if state:
+        return ActiveIndex(collection_name, state["embedding_model"], state["embedding_dim"] or 0)
+    return None